@@ -0,0 +1,181 @@
+import threading
+import time
+
+from metrics import get_metrics
+
+# Airtable accepts at most 10 records per create/update/delete request
+MAX_BATCH_SIZE = 10
+
+
+class BatchWriter:
+    """Write-behind buffer that groups single-record writes into batch calls.
+
+    Writes are queued per table and sent as 10-record batch requests when a
+    buffer fills up, when a write arrives while the oldest queued write is
+    older than ``max_age`` seconds, or when ``flush()`` is called (also on
+    leaving a ``with`` block). There is no timer: writes queued by an idle
+    caller wait for its next write or flush.
+
+    A failed batch is retried record by record so every error can be traced
+    back to the record that caused it. ``flush()`` returns every error not
+    yet returned, including those from automatic flushes.
+    """
+
+    def __init__(self, api, base_id, batch_size=MAX_BATCH_SIZE, max_age=5.0):
+        self.api = api
+        self.base_id = base_id
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_age = max_age
+
+        self._creates = {}  # table name -> [fields, ...]
+        self._updates = {}  # table name -> {record_id: fields}
+        self._deletes = {}  # table name -> [record_id, ...]
+        self._upserts = {}  # (table name, key fields) -> {key values: fields}
+        self._oldest = None
+        self._lock = threading.RLock()
+
+        self.errors = []
+        self._reported = 0  # errors already returned by flush()
+        self.requests = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def create(self, table_name, fields):
+        with self._lock:
+            pending = self._creates.setdefault(table_name, [])
+            pending.append(fields)
+            self._queued()
+            if len(pending) >= self.batch_size:
+                self._flush_creates(table_name)
+
+    def update(self, table_name, record_id, fields):
+        with self._lock:
+            pending = self._updates.setdefault(table_name, {})
+            # Several updates to the same record collapse into one
+            pending.setdefault(record_id, {}).update(fields)
+            self._queued()
+            if len(pending) >= self.batch_size:
+                self._flush_updates(table_name)
+
+    def upsert(self, table_name, fields, key_fields):
+        # Creates or updates the record whose key_fields match
+        with self._lock:
+            pending = self._upserts.setdefault((table_name, tuple(key_fields)), {})
+            key = tuple(fields.get(k) for k in key_fields)
+            pending.setdefault(key, {}).update(fields)
+            self._queued()
+            if len(pending) >= self.batch_size:
+                self._flush_upserts(table_name, tuple(key_fields))
+
+    def delete(self, table_name, record_id):
+        with self._lock:
+            pending = self._deletes.setdefault(table_name, [])
+            pending.append(record_id)
+            self._queued()
+            if len(pending) >= self.batch_size:
+                self._flush_deletes(table_name)
+
+    def pending_count(self):
+        with self._lock:
+            return (sum(len(p) for p in self._creates.values())
+                    + sum(len(p) for p in self._updates.values())
+                    + sum(len(p) for p in self._deletes.values())
+                    + sum(len(p) for p in self._upserts.values()))
+
+    def flush(self):
+        """Send every queued write and return the per-record errors not reported yet."""
+        with self._lock:
+            self._flush_all()
+            errors, self._reported = self.errors[self._reported:], len(self.errors)
+            return errors
+
+    def _flush_all(self):
+        with self._lock:
+            for table_name in list(self._deletes):
+                self._flush_deletes(table_name)
+            for table_name in list(self._creates):
+                self._flush_creates(table_name)
+            for table_name, key_fields in list(self._upserts):
+                self._flush_upserts(table_name, key_fields)
+            for table_name in list(self._updates):
+                self._flush_updates(table_name)
+            self._oldest = None
+
+    def _queued(self):
+        now = time.monotonic()
+        if self._oldest is None:
+            self._oldest = now
+        elif self.max_age is not None and now - self._oldest >= self.max_age:
+            self._flush_all()
+
+    def _flush_creates(self, table_name):
+        pending = self._creates.pop(table_name, [])
+        table = self.api.table(self.base_id, table_name)
+        for batch in self._chunks(pending):
+            self._send(table_name, 'create', batch,
+                       lambda b: table.batch_create(b),
+                       lambda fields: table.create(fields))
+
+    def _flush_updates(self, table_name):
+        pending = self._updates.pop(table_name, {})
+        records = [{'id': record_id, 'fields': fields} for record_id, fields in pending.items()]
+        table = self.api.table(self.base_id, table_name)
+        for batch in self._chunks(records):
+            self._send(table_name, 'update', batch,
+                       lambda b: table.batch_update(b),
+                       lambda record: table.update(record['id'], record['fields']))
+
+    def _flush_upserts(self, table_name, key_fields):
+        pending = self._upserts.pop((table_name, key_fields), {})
+        records = [{'fields': fields} for fields in pending.values()]
+        table = self.api.table(self.base_id, table_name)
+        for batch in self._chunks(records):
+            self._send(table_name, 'upsert', batch,
+                       lambda b: table.batch_upsert(b, key_fields=list(key_fields)),
+                       lambda record: table.batch_upsert([record], key_fields=list(key_fields)))
+
+    def _flush_deletes(self, table_name):
+        pending = self._deletes.pop(table_name, [])
+        table = self.api.table(self.base_id, table_name)
+        for batch in self._chunks(pending):
+            self._send(table_name, 'delete', batch,
+                       lambda b: table.batch_delete(b),
+                       lambda record_id: table.delete(record_id))
+
+    def _send(self, table_name, operation, batch, send_batch, send_one):
+        try:
+            self.requests += 1
+            send_batch(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self._record_error(table_name, operation, batch[0], e)
+                return
+            print(f"Batch {operation} on {table_name} failed ({e}), retrying per record")
+            get_metrics().inc('airtable_write_retries_total', len(batch), table=table_name, operation=operation)
+
+        # Airtable rejects the whole batch if one record is invalid, so
+        # replay it one record at a time to find the offending ones
+        for item in batch:
+            try:
+                self.requests += 1
+                send_one(item)
+            except Exception as e:
+                self._record_error(table_name, operation, item, e)
+
+    def _record_error(self, table_name, operation, record, error):
+        print(f"Failed to {operation} record in {table_name}: {error}")
+        self.errors.append({
+            'table': table_name,
+            'operation': operation,
+            'record': record,
+            'error': str(error)
+        })
+
+    def _chunks(self, items):
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
@@ -0,0 +1,253 @@
+"""Offline throughput benchmark for the applicant pipeline.
+
+Runs the real components against an in-process FakeAirtable server and a
+FakeGeminiModel, on synthetic populations, and reports wall time, request
+counts and p50/p99 latency per stage.
+
+    python benchmark.py --sizes 100 1000 --airtable-latency 0.05 --llm-latency 0.5
+"""
+import argparse
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from fakes import FakeAirtable, FakeGeminiModel
+
+BASE_ID = 'appBENCHMARK00001'
+
+TABLES = ['Applicants', 'Personal Details', 'Work Experience', 'Salary Preferences', 'Shortlisted Leads']
+
+COMPANIES = ['Google', 'Meta', 'Stripe', 'Acme Corp', 'Initech', 'Globex', 'Hooli', 'Umbrella', 'Vandelay']
+TITLES = ['Software Engineer', 'Data Scientist', 'Product Manager', 'ML Engineer', 'Designer']
+LOCATIONS = ['San Francisco, USA', 'Toronto, Canada', 'London, UK', 'Berlin, Germany',
+             'Bangalore, India', 'Lagos, Nigeria', 'Sao Paulo, Brazil', 'Sydney, Australia']
+TECHNOLOGIES = ['Python', 'Go', 'React', 'PostgreSQL', 'Kubernetes', 'PyTorch', 'AWS']
+
+
+def generate_population(airtable, count, seed=0):
+    """Seed ``count`` applicants with 1-4 jobs each straight into the fake's tables."""
+    rng = random.Random(seed)
+    for table_name in TABLES:
+        airtable.create_table(BASE_ID, table_name)
+
+    applicants, personal, experience, salary = [], [], [], []
+    for n in range(1, count + 1):
+        applicant_id = f"{n:06d}"
+        applicants.append({'Applicant ID': applicant_id})
+        personal.append({
+            'Applicant ID': applicant_id,
+            'Full Name': f"Applicant {n}",
+            'Email': f"applicant{n}@example.com",
+            'Location': rng.choice(LOCATIONS),
+            'LinkedIn': f"https://linkedin.com/in/applicant{n}"
+        })
+        year = rng.randint(2008, 2020)
+        for _ in range(rng.randint(1, 4)):
+            length = rng.randint(1, 3)
+            experience.append({
+                'Applicant ID': applicant_id,
+                'Company': rng.choice(COMPANIES),
+                'Title': rng.choice(TITLES),
+                'Start Date': f"{year}-{rng.randint(1, 12):02d}-01",
+                'End Date': f"{year + length}-{rng.randint(1, 12):02d}-01",
+                'Technologies': ', '.join(rng.sample(TECHNOLOGIES, 3))
+            })
+            year += length
+        salary.append({
+            'Applicant ID': applicant_id,
+            'Preferred Rate': rng.choice([60, 80, 95, 110, 140]),
+            'Minimum Rate': 50,
+            'Currency Type': 'USD',
+            'Availability': rng.choice([10, 20, 30, 40])
+        })
+
+    airtable.insert(BASE_ID, 'Applicants', applicants)
+    airtable.insert(BASE_ID, 'Personal Details', personal)
+    airtable.insert(BASE_ID, 'Work Experience', experience)
+    airtable.insert(BASE_ID, 'Salary Preferences', salary)
+
+
+class StageTimer:
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def wrap(self, obj, method_name, stage):
+        # Replace obj.method_name with a version that records its duration
+        method = getattr(obj, method_name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.durations[stage].append(time.perf_counter() - started)
+
+        setattr(obj, method_name, timed)
+
+    def report(self):
+        stages = {}
+        for stage, values in self.durations.items():
+            values = sorted(values)
+            stages[stage] = {
+                'count': len(values),
+                'total_s': round(sum(values), 3),
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1)
+            }
+        return stages
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def edit_profiles(airtable, applicant_ids, seed=0):
+    # Change the stored JSON of some applicants so decompress has work to do
+    from json_codec import decode_profile, encode_profile
+    rng = random.Random(seed)
+    table = airtable.tables[(BASE_ID, 'Applicants')]
+    for record in table.values():
+        if record['fields'].get('Applicant ID') in applicant_ids and record['fields'].get('Compressed JSON'):
+            data = decode_profile(record['fields']['Compressed JSON'])
+            data['salary']['preferred_rate'] = rng.choice([70, 90, 120])
+            if data['experience']:
+                data['experience'][-1]['title'] = 'Staff ' + data['experience'][-1]['title']
+            record['fields']['Compressed JSON'] = encode_profile(data)
+
+
+def run_benchmark(size, airtable_latency=0.0, airtable_rate=5.0, llm_latency=0.5, llm_jitter=0.1,
+                  llm_error_rate=0.0, concurrency=None, decompress_sample=50, seed=0):
+    airtable = FakeAirtable(latency=airtable_latency, jitter=airtable_latency / 4, rate=airtable_rate, seed=seed)
+    generate_population(airtable, size, seed)
+    url = airtable.start()
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    os.environ.update({
+        'AIRTABLE_ENDPOINT_URL': url,
+        'AIRTABLE_API_KEY': 'benchmark-key',
+        'AIRTABLE_BASE_ID': BASE_ID,
+        'AIRTABLE_RATE': str(airtable_rate),
+        'LLM_CACHE_PATH': os.path.join(workdir, 'llm_cache.sqlite'),
+        'CHECKPOINT_PATH': os.path.join(workdir, 'checkpoint.sqlite'),
+        'CHILD_INDEX_PATH': os.path.join(workdir, 'child_rows.sqlite'),
+    })
+
+    # Imported late so every component picks up the environment above
+    from decompress import AirtableDecompressor
+    from master_script import ApplicationProcessor
+    from request_scheduler import get_scheduler
+
+    try:
+        processor = ApplicationProcessor()
+        model = FakeGeminiModel(latency=llm_latency, jitter=llm_jitter, error_rate=llm_error_rate, seed=seed)
+        processor.llm_evaluator.model = model
+
+        timer = StageTimer()
+        timer.wrap(processor, 'compress_applicant', 'compress')
+        timer.wrap(processor.compressor, 'get_all_applicant_data', 'fetch child rows (per page)')
+        timer.wrap(processor, 'shortlist_applicant', 'shortlist')
+        timer.wrap(processor.llm_evaluator, 'call_llm', 'llm')
+        timer.wrap(processor.llm_evaluator, 'call_llm_batch', 'llm (batched request)')
+        timer.wrap(processor, 'flush_writes', 'write flush')
+        if not concurrency:
+            timer.wrap(processor, 'process_page', 'page')
+
+        scheduler = get_scheduler()
+        requests_before, throttled_before = scheduler.requests, scheduler.throttled
+        started = time.perf_counter()
+        processor.process_all_applicants(concurrency=concurrency)
+        pipeline_seconds = time.perf_counter() - started
+
+        # Decompress a sample of edited profiles back into the child tables
+        sample = [f"{n:06d}" for n in range(1, min(size, decompress_sample) + 1)]
+        edit_profiles(airtable, set(sample), seed)
+        decompressor = AirtableDecompressor(api=processor.api)
+        timer.wrap(decompressor, 'decompress_applicant_data', 'decompress')
+        started = time.perf_counter()
+        for applicant_id in sample:
+            decompressor.decompress_applicant_data(applicant_id)
+        decompress_seconds = time.perf_counter() - started
+
+        applicants = airtable.records(BASE_ID, 'Applicants')
+        evaluated = sum(1 for r in applicants if r['fields'].get('LLM Summary'))
+        return {
+            'size': size,
+            'pipeline_wall_s': round(pipeline_seconds, 2),
+            # Only applicants that made it through count towards throughput
+            'applicants_per_s': round(evaluated / pipeline_seconds, 2) if pipeline_seconds else None,
+            'decompress_wall_s': round(decompress_seconds, 2),
+            'evaluated': evaluated,
+            'airtable_requests': scheduler.requests - requests_before,
+            'airtable_throttled': scheduler.throttled - throttled_before,
+            'requests_by_table': {f"{table} {operation}": count
+                                  for (table, operation), count in sorted(airtable.requests.items())},
+            'gemini_calls': model.calls,
+            'gemini_errors': model.errors,
+            'prompt_tokens': processor.llm_evaluator.prompts.stats(),
+            'stages': timer.report()
+        }
+    finally:
+        airtable.stop()
+
+
+def print_report(report):
+    print(f"\n=== {report['size']} applicants ===")
+    print(f"Pipeline wall time: {report['pipeline_wall_s']}s ({report['applicants_per_s']} applicants/s)")
+    print(f"Decompress wall time: {report['decompress_wall_s']}s")
+    print(f"Evaluated: {report['evaluated']} of {report['size']}")
+    print(f"Airtable requests: {report['airtable_requests']} ({report['airtable_throttled']} throttled)")
+    for name, count in report['requests_by_table'].items():
+        print(f"  {name:40} {count}")
+    print(f"Gemini calls: {report['gemini_calls']} ({report['gemini_errors']} errors)")
+    prompts = report['prompt_tokens']
+    print(f"Prompt tokens (estimated): {prompts['legacy_tokens']} before -> {prompts['compact_tokens']} after "
+          f"({prompts['saved_pct']}% saved)")
+    print(f"{'stage':32} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:32} {stats['count']:>7} {stats['total_s']:>9} {stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100], help='populations to run, e.g. 100 1000 10000')
+    parser.add_argument('--airtable-latency', type=float, default=0.05, help='seconds added to every Airtable request')
+    parser.add_argument('--airtable-rate', type=float, default=5.0, help='requests/second per base (Airtable allows 5)')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='seconds per Gemini call')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='share of Gemini calls that fail with a 503')
+    parser.add_argument('--concurrency', type=int, default=0, help='LLM workers for PipelineExecutor (0: page mode)')
+    parser.add_argument('--decompress-sample', type=int, default=50, help='applicants to decompress')
+    parser.add_argument('--json', help='also write the reports to this file')
+    args = parser.parse_args()
+
+    concurrency = {'llm': args.concurrency} if args.concurrency else None
+    reports = []
+    for size in args.sizes:
+        report = run_benchmark(size, airtable_latency=args.airtable_latency, airtable_rate=args.airtable_rate,
+                               llm_latency=args.llm_latency, llm_error_rate=args.llm_error_rate,
+                               concurrency=concurrency, decompress_sample=args.decompress_sample)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+    incomplete = [r for r in reports if r['evaluated'] != r['size']]
+    if incomplete:
+        parser.exit(1, "Benchmark incomplete: " + ", ".join(
+            f"{r['size'] - r['evaluated']} of {r['size']} applicants not evaluated" for r in incomplete) + "\n")
+
+
+if __name__ == "__main__":
+    main()
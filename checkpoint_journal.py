@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_JOURNAL_PATH = '.checkpoint.sqlite'
+
+STAGES = ('compress', 'shortlist', 'llm')
+
+
+def input_hash(value):
+    # Stable digest of a stage's input (dicts are hashed key-order independent)
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class CheckpointJournal:
+    """Local SQLite record of how far each applicant got in a run.
+
+    Every finished stage is stored with the hash of its input and the
+    fields it produced. An applicant stays ``running`` until its merged
+    Applicants update has been written, so after a crash the next run can
+    re-apply the finished stages and resend the lost writes instead of
+    repeating the work.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('CHECKPOINT_PATH', DEFAULT_JOURNAL_PATH)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS applicants (
+                applicant_id TEXT PRIMARY KEY,
+                record_id TEXT,
+                state TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stages (
+                applicant_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (applicant_id, stage)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS applicants_state ON applicants (state)")
+        self._conn.commit()
+
+    def start(self, applicant_id, record_id):
+        # Stage results from a finished earlier run are not reused
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM applicants WHERE applicant_id = ?", (applicant_id,)
+            ).fetchone()
+            if row is not None and row[0] == 'running':
+                return
+            self._conn.execute("DELETE FROM stages WHERE applicant_id = ?", (applicant_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO applicants (applicant_id, record_id, state, updated) "
+                "VALUES (?, ?, 'running', ?)",
+                (applicant_id, record_id, now)
+            )
+            self._conn.commit()
+
+    def record(self, applicant_id, stage, key, result):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (applicant_id, stage, input_hash, result, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (applicant_id, stage, key, json.dumps(result), time.time())
+            )
+            self._conn.commit()
+
+    def lookup(self, applicant_id, stage, key):
+        # Result of a stage already finished for this exact input, or None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.result FROM stages s JOIN applicants a USING (applicant_id) "
+                "WHERE s.applicant_id = ? AND s.stage = ? AND s.input_hash = ? AND a.state = 'running'",
+                (applicant_id, stage, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_done(self, applicant_ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE applicants SET state = 'done', updated = ? WHERE applicant_id = ?",
+                [(now, a) for a in applicant_ids]
+            )
+            self._conn.commit()
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT applicant_id FROM applicants WHERE state = 'running' ORDER BY updated"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def status(self):
+        with self._lock:
+            states = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM applicants GROUP BY state"
+            ).fetchall())
+            stages = dict(self._conn.execute(
+                "SELECT s.stage, COUNT(*) FROM stages s JOIN applicants a USING (applicant_id) "
+                "WHERE a.state = 'running' GROUP BY s.stage"
+            ).fetchall())
+            last_update = self._conn.execute("SELECT MAX(updated) FROM applicants").fetchone()[0]
+        return {
+            'done': states.get('done', 0),
+            'unfinished': states.get('running', 0),
+            'unfinished_stages': {stage: stages.get(stage, 0) for stage in STAGES},
+            'last_update': last_update
+        }
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM stages")
+            self._conn.execute("DELETE FROM applicants")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def print_status(journal):
+    status = journal.status()
+    print(f"Checkpoint journal: {journal.path}")
+    print(f"  Done:       {status['done']}")
+    print(f"  Unfinished: {status['unfinished']}")
+    for stage, count in status['unfinished_stages'].items():
+        print(f"    {stage + ' finished:':20} {count}")
+    if status['last_update']:
+        print(f"  Last update: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(status['last_update']))}")
+
+
+# Usage: python checkpoint_journal.py
+if __name__ == "__main__":
+    print_status(CheckpointJournal())
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+
+DEFAULT_INDEX_PATH = '.child_rows.sqlite'
+
+
+class ChildRowIndex:
+    """Local SQLite map from child-table record IDs to their Applicant ID.
+
+    A deleted row can no longer be read from Airtable, so this is the only
+    way to tell whose profile it belonged to. Rows are recorded whenever
+    an applicant's child rows are read in full, and when webhook payloads
+    mention them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('CHILD_INDEX_PATH', DEFAULT_INDEX_PATH)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS child_rows (
+                record_id TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                applicant_id TEXT NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS child_rows_applicant ON child_rows (table_name, applicant_id)"
+        )
+        self._conn.commit()
+
+    def add(self, table_name, rows):
+        # rows: {record ID: Applicant ID}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO child_rows (record_id, table_name, applicant_id) VALUES (?, ?, ?)",
+                [(record_id, table_name, applicant_id) for record_id, applicant_id in rows.items() if applicant_id]
+            )
+            self._conn.commit()
+
+    def replace(self, table_name, applicant_ids, records):
+        # records are every row ``applicant_ids`` have in the table, so rows
+        # recorded earlier and missing now were deleted
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM child_rows WHERE table_name = ? AND applicant_id = ?",
+                [(table_name, applicant_id) for applicant_id in applicant_ids]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO child_rows (record_id, table_name, applicant_id) VALUES (?, ?, ?)",
+                [(r['id'], table_name, r['fields']['Applicant ID']) for r in records
+                 if r['fields'].get('Applicant ID') in applicant_ids]
+            )
+            self._conn.commit()
+
+    def applicants(self, record_ids):
+        # {record ID: Applicant ID} for the record IDs that are known
+        record_ids = list(record_ids)
+        found = {}
+        with self._lock:
+            for i in range(0, len(record_ids), 500):
+                chunk = record_ids[i:i + 500]
+                found.update(self._conn.execute(
+                    f"SELECT record_id, applicant_id FROM child_rows WHERE record_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall())
+        return found
+
+    def rows(self, table_name):
+        # {record ID: Applicant ID} for every known row of the table
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT record_id, applicant_id FROM child_rows WHERE table_name = ?", (table_name,)
+            ).fetchall())
+
+    def forget(self, record_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM child_rows WHERE record_id = ?", [(r,) for r in record_ids])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,18 +1,43 @@
 
 
 import os
-from pyairtable import Api
+from request_scheduler import create_api
 from dotenv import load_dotenv
-import json
 from datetime import datetime
+from batch_writer import BatchWriter
+from json_codec import encode_profile
+from metrics import timed
 
 load_dotenv()
 
+# Child-table fields read when building the compressed JSON
+PERSONAL_FIELDS = ['Full Name', 'Email', 'Location', 'LinkedIn']
+EXPERIENCE_FIELDS = ['Company', 'Title', 'Start Date', 'End Date', 'Technologies']
+SALARY_FIELDS = ['Preferred Rate', 'Minimum Rate', 'Currency Type', 'Availability']
+
+CHILD_TABLES = {
+    'Personal Details': PERSONAL_FIELDS,
+    'Work Experience': EXPERIENCE_FIELDS,
+    'Salary Preferences': SALARY_FIELDS,
+}
+
+# Up to this many applicants, child rows are fetched with OR(...) filters
+# instead of scanning the whole table
+TARGETED_FETCH_LIMIT = 200
+ID_CHUNK_SIZE = 50
+
 class AirtableCompressor:
-    def __init__(self):
-        self.api = Api(os.getenv('AIRTABLE_API_KEY'))
+    def __init__(self, writer=None, api=None, child_rows=None):
+        self.api = api or create_api()
         self.base_id = os.getenv('AIRTABLE_BASE_ID')
         
+        # Writes are buffered; a shared writer is flushed by its owner
+        self.writer = writer or BatchWriter(self.api, self.base_id)
+        self.owns_writer = writer is None
+        
+        # Optional ChildRowIndex, refreshed with every applicant's rows read here
+        self.child_rows = child_rows
+        
     def get_applicant_data(self, applicant_id):
         # Get data from all linked tables
         personal = self.api.table(self.base_id, 'Personal Details')
@@ -24,6 +49,88 @@ class AirtableCompressor:
         experience_records = experience.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
         salary_records = salary.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
         
+        if self.child_rows is not None:
+            for table_name, records in zip(CHILD_TABLES, (personal_records, experience_records, salary_records)):
+                self.child_rows.replace(table_name, {applicant_id}, records)
+        return self.build_applicant_json(personal_records, experience_records, salary_records)
+
+    @timed('fetch_child_rows')
+    def get_all_applicant_data(self, applicant_ids=None):
+        # Bulk mode: page through each child table once and build every
+        # applicant's JSON from an in-memory index instead of 3 scans per applicant
+        rows = {table_name: self._fetch_child_rows(table_name, applicant_ids) for table_name in CHILD_TABLES}
+        personal_index = self._index_by_applicant(rows['Personal Details'])
+        experience_index = self._index_by_applicant(rows['Work Experience'])
+        salary_index = self._index_by_applicant(rows['Salary Preferences'])
+
+        if applicant_ids is None:
+            applicant_ids = set(personal_index) | set(experience_index) | set(salary_index)
+        if self.child_rows is not None:
+            for table_name, records in rows.items():
+                self.child_rows.replace(table_name, set(applicant_ids), records)
+
+        return {
+            applicant_id: self.build_applicant_json(
+                personal_index.get(applicant_id, []),
+                experience_index.get(applicant_id, []),
+                salary_index.get(applicant_id, [])
+            )
+            for applicant_id in applicant_ids
+        }
+
+    def get_changed_applicant_ids(self, formula):
+        # Applicant IDs with a child row matching formula (e.g. modified since a watermark)
+        changed = set()
+        for table_name in CHILD_TABLES:
+            table = self.api.table(self.base_id, table_name)
+            for record in table.all(formula=formula, fields=['Applicant ID']):
+                if record['fields'].get('Applicant ID'):
+                    changed.add(record['fields']['Applicant ID'])
+        return changed
+
+    def get_deleted_applicant_ids(self):
+        # Applicant IDs with an indexed child row that is gone from Airtable.
+        # A modified-time filter never sees a deleted row, so each table's
+        # current record IDs are listed and compared with the index.
+        if self.child_rows is None:
+            return set()
+        deleted = set()
+        for table_name in CHILD_TABLES:
+            known = self.child_rows.rows(table_name)
+            if not known:
+                continue
+            table = self.api.table(self.base_id, table_name)
+            present = {record['id'] for record in table.all(fields=['Applicant ID'])}
+            gone = [record_id for record_id in known if record_id not in present]
+            deleted.update(known[record_id] for record_id in gone)
+            self.child_rows.forget(gone)
+        return deleted
+
+    def _fetch_child_rows(self, table_name, applicant_ids=None):
+        table = self.api.table(self.base_id, table_name)
+        fields = ['Applicant ID'] + CHILD_TABLES[table_name]
+        if applicant_ids is None or len(applicant_ids) > TARGETED_FETCH_LIMIT:
+            return table.all(fields=fields)
+
+        # Small ID sets: one filtered query per chunk of IDs
+        applicant_ids = list(applicant_ids)
+        records = []
+        for i in range(0, len(applicant_ids), ID_CHUNK_SIZE):
+            chunk = applicant_ids[i:i + ID_CHUNK_SIZE]
+            formula = "OR(" + ", ".join(f"{{Applicant ID}} = '{a}'" for a in chunk) + ")"
+            records.extend(table.all(formula=formula, fields=fields))
+        return records
+
+    def _index_by_applicant(self, records):
+        index = {}
+        for record in records:
+            applicant_id = record['fields'].get('Applicant ID')
+            if applicant_id:
+                index.setdefault(applicant_id, []).append(record)
+        return index
+
+    @staticmethod
+    def build_applicant_json(personal_records, experience_records, salary_records):
         # Build JSON structure
         data = {
             "personal": {},
@@ -61,17 +168,25 @@ class AirtableCompressor:
             
         return data
     
-    def update_applicant_json(self, applicant_id, json_data):
+    @timed('compress')
+    def update_applicant_json(self, applicant_id, json_data, context=None):
+        # With a run context the write is merged into the record's single update
+        if context is not None:
+            context.set_profile(json_data, encode_profile(json_data))
+            return True
+            
         applicants = self.api.table(self.base_id, 'Applicants')
         
         # Find the applicant record
-        records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
+        records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'", fields=['Applicant ID'])
         
         if records:
             record_id = records[0]['id']
-            applicants.update(record_id, {
-                'Compressed JSON': json.dumps(json_data, indent=2)
+            self.writer.update('Applicants', record_id, {
+                'Compressed JSON': encode_profile(json_data)
             })
+            if self.owns_writer:
+                return not self.writer.flush()
             return True
         return False
 
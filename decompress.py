@@ -1,14 +1,23 @@
 import os
-from pyairtable import Api
+from request_scheduler import create_api
 from dotenv import load_dotenv
-import json
+from batch_writer import BatchWriter
+from compress_data import AirtableCompressor
+from json_codec import decode_profile
+from metrics import timed
 
 load_dotenv()
 class AirtableDecompressor:
-    def __init__(self):
+    def __init__(self, writer=None, api=None):
         
-        self.api = Api(os.getenv('AIRTABLE_API_KEY'))
+        self.api = api or create_api()
         self.base_id = os.getenv('AIRTABLE_BASE_ID')
+        
+        # Writes are buffered; a shared writer is flushed by its owner
+        self.writer = writer or BatchWriter(self.api, self.base_id)
+        self.owns_writer = writer is None
+        
+    @timed('decompress')
     def decompress_applicant_data(self, applicant_id):
         # Get the compressed JSON from Applicants table
         applicants = self.api.table(self.base_id, 'Applicants')
@@ -24,27 +33,42 @@ class AirtableDecompressor:
             return False
             
         try:
-            data = json.loads(compressed_json)
-        except json.JSONDecodeError:
+            data = decode_profile(compressed_json)
+        except ValueError:
             print(f"Invalid JSON for applicant: {applicant_id}")
             return False
             
+        # Read the current child rows once and diff the payload against them
+        personal_records = self.fetch_child_records('Personal Details', applicant_id)
+        experience_records = self.fetch_child_records('Work Experience', applicant_id)
+        salary_records = self.fetch_child_records('Salary Preferences', applicant_id)
+        
+        # No-op fast path: tables already hold exactly this payload
+        current = AirtableCompressor.build_applicant_json(personal_records, experience_records, salary_records)
+        if current == data:
+            return True
+            
         # Update Personal Details
-        self.update_personal_details(applicant_id, data.get('personal', {}))
+        self.update_personal_details(applicant_id, data.get('personal', {}), personal_records)
         
         # Update Work Experience  
-        self.update_work_experience(applicant_id, data.get('experience', []))
+        self.update_work_experience(applicant_id, data.get('experience', []), experience_records)
         
         # Update Salary Preferences
-        self.update_salary_preferences(applicant_id, data.get('salary', {}))
+        self.update_salary_preferences(applicant_id, data.get('salary', {}), salary_records)
         
+        if self.owns_writer:
+            return not self.writer.flush()
         return True
         
-    def update_personal_details(self, applicant_id, personal_data):
-        table = self.api.table(self.base_id, 'Personal Details')
+    def fetch_child_records(self, table_name, applicant_id):
+        table = self.api.table(self.base_id, table_name)
+        return table.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
         
+    def update_personal_details(self, applicant_id, personal_data, records=None):
         # Check if record exists
-        records = table.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
+        if records is None:
+            records = self.fetch_child_records('Personal Details', applicant_id)
         
         fields = {
             'Full Name': personal_data.get('name', ''),
@@ -54,34 +78,49 @@ class AirtableDecompressor:
             'Applicant ID': applicant_id
         }
         
-        if records:
-            table.update(records[0]['id'], fields)
-        else:
-            table.create(fields)
+        self.upsert_single('Personal Details', records, fields)
             
-    def update_work_experience(self, applicant_id, experience_data):
-        table = self.api.table(self.base_id, 'Work Experience')
-        
-        # Delete existing records for this applicant
-        existing = table.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
-        for record in existing:
-            table.delete(record['id'])
-            
-        # Create new records
-        for exp in experience_data:
-            table.create({
-                'Company': exp.get('company', ''),
-                'Title': exp.get('title', ''),
-                'Start Date': exp.get('start_date', ''),
-                'End Date': exp.get('end_date', ''),
-                'Technologies': exp.get('technologies', ''),
-                'Applicant ID': applicant_id
-            })
+    def update_work_experience(self, applicant_id, experience_data, existing=None):
+        if existing is None:
+            existing = self.fetch_child_records('Work Experience', applicant_id)
             
-    def update_salary_preferences(self, applicant_id, salary_data):
-        table = self.api.table(self.base_id, 'Salary Preferences')
+        desired = [{
+            'Company': exp.get('company', ''),
+            'Title': exp.get('title', ''),
+            'Start Date': exp.get('start_date', ''),
+            'End Date': exp.get('end_date', ''),
+            'Technologies': exp.get('technologies', ''),
+            'Applicant ID': applicant_id
+        } for exp in experience_data]
         
-        records = table.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
+        # Rows that already match exactly are left alone
+        unmatched = list(existing)
+        remaining = []
+        for fields in desired:
+            match = next((r for r in unmatched if not changed_fields(r['fields'], fields)), None)
+            if match:
+                unmatched.remove(match)
+            else:
+                remaining.append(fields)
+                
+        # Rows for the same job (company + start date) are updated with only
+        # the fields that differ, so record IDs stay stable for anything
+        # linking to them. Other rows are never repurposed for a different
+        # job: they are deleted, and new jobs get new rows
+        for fields in remaining:
+            match = next((r for r in unmatched if same_job(r['fields'], fields)), None)
+            if match:
+                unmatched.remove(match)
+                self.writer.update('Work Experience', match['id'], changed_fields(match['fields'], fields))
+            else:
+                self.writer.create('Work Experience', fields)
+                
+        for record in unmatched:
+            self.writer.delete('Work Experience', record['id'])
+            
+    def update_salary_preferences(self, applicant_id, salary_data, records=None):
+        if records is None:
+            records = self.fetch_child_records('Salary Preferences', applicant_id)
         
         fields = {
             'Preferred Rate': salary_data.get('preferred_rate', 0),
@@ -91,10 +130,31 @@ class AirtableDecompressor:
             'Applicant ID': applicant_id
         }
         
-        if records:
-            table.update(records[0]['id'], fields)
-        else:
-            table.create(fields)
+        self.upsert_single('Salary Preferences', records, fields)
+        
+    def upsert_single(self, table_name, records, fields):
+        # One row per applicant: create it, or send only the changed fields
+        if not records:
+            self.writer.create(table_name, fields)
+            return
+        changes = changed_fields(records[0]['fields'], fields)
+        if changes:
+            self.writer.update(table_name, records[0]['id'], changes)
+
+def changed_fields(current, desired):
+    # Airtable omits empty cells, so a missing field matches the empty
+    # value of the desired type ('' for text, 0 for numbers)
+    return {
+        name: value for name, value in desired.items()
+        if current.get(name, empty_value(value)) != value
+    }
+
+def empty_value(value):
+    return type(value)() if isinstance(value, (str, int, float, list)) else None
+
+def same_job(current, desired):
+    return (current.get('Company', '') == desired['Company']
+            and current.get('Start Date', '') == desired['Start Date'])
 
 # Usage
 if __name__ == "__main__":
@@ -0,0 +1,507 @@
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from google.api_core import exceptions as google_exceptions
+
+# Airtable API limits the fake enforces
+MAX_RECORDS_PER_REQUEST = 10
+MAX_PAGE_SIZE = 100
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, output_tokens)
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeGeminiModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Answers single and batched evaluation prompts in the formats
+    LLMEvaluator expects, after ``latency`` (+/- ``jitter``) seconds. A
+    ``throttle_rate`` share of calls raise a 429 carrying ``retry_after``
+    and an ``error_rate`` share raise a 503, so retry and backoff paths can
+    be exercised without an API key. Results are cached under
+    ``model_name``, apart from real Gemini results.
+    """
+
+    model_name = 'fake-gemini'
+
+    def __init__(self, latency=0.5, jitter=0.1, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1.0, max_concurrency=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            overloaded = self.max_concurrency is not None and self.in_flight > self.max_concurrency
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(delay)
+            if overloaded or roll < self.throttle_rate:
+                self._count_error()
+                error = google_exceptions.ResourceExhausted("Quota exceeded, please retry later")
+                error.retry_after = self.retry_after
+                raise error
+            if roll < self.throttle_rate + self.error_rate:
+                self._count_error()
+                raise google_exceptions.ServiceUnavailable("The model is overloaded")
+            text = self.respond(prompt)
+            return FakeResponse(text, len(prompt) // 4 + 1, len(text) // 4 + 1)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def respond(self, prompt):
+        applicant_ids = re.findall(r'"applicant_id":\s*"([^"]+)"', prompt)
+        if applicant_ids:
+            return json.dumps([{
+                'applicant_id': applicant_id,
+                'summary': f"Synthetic summary for applicant {applicant_id}.",
+                'score': 7,
+                'issues': 'None',
+                'follow_ups': ['What is your notice period?']
+            } for applicant_id in applicant_ids])
+        return ("Summary: Synthetic summary for this applicant.\n"
+                "Score: 7\n"
+                "Issues: None\n"
+                "Follow-Ups: - What is your notice period?")
+
+    def _count_error(self):
+        with self._lock:
+            self.errors += 1
+
+
+class AirtableError(Exception):
+    def __init__(self, status, error_type, message=''):
+        super().__init__(message or error_type)
+        self.status = status
+        self.error_type = error_type
+
+
+class FakeAirtable:
+    """In-process HTTP stand-in for the Airtable REST API.
+
+    Serves list (GET and POST listRecords, with pagination, ``fields[]`` and
+    ``filterByFormula``), get, create, update, upsert and delete for the
+    tables it holds. Batches are limited to 10 records and pages to 100. A
+    base gets a 429 with ``Retry-After`` once it exceeds ``rate`` requests
+    per second. Every request waits ``latency`` (+/- ``jitter``) seconds.
+    Point pyairtable at ``url`` with ``endpoint_url`` or AIRTABLE_ENDPOINT_URL.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate=5.0, retry_after=1.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate = rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.tables = {}  # (base ID, table name) -> {record ID: record}
+        self.requests = Counter()  # (table name, operation) -> count
+        self.throttled = 0
+
+        self._ids = itertools.count(1)
+        self._iterators = itertools.count(1)
+        self._offsets = {}  # offset token -> (record IDs the listing matched, next position)
+        self._windows = {}  # base ID -> request times in the last second
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                status, payload, headers = fake.handle(self.command, self.path, body,
+                                                       self.headers.get('Authorization'))
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-airtable', daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def create_table(self, base_id, table_name):
+        with self._lock:
+            return self.tables.setdefault((base_id, table_name), {})
+
+    def insert(self, base_id, table_name, rows):
+        # Seeds records directly, without going through HTTP or the rate limit
+        with self._lock:
+            table = self.tables.setdefault((base_id, table_name), {})
+            records = [self._new_record(fields) for fields in rows]
+            for record in records:
+                table[record['id']] = record
+        return [self._public(record) for record in records]
+
+    def records(self, base_id, table_name):
+        with self._lock:
+            return [self._public(r) for r in self.tables.get((base_id, table_name), {}).values()]
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+            self.throttled = 0
+
+    def handle(self, method, raw_path, body, authorization=None):
+        # Returns (status, JSON payload, extra headers)
+        url = urlparse(raw_path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        query = parse_qs(url.query)
+        if not authorization or not authorization.startswith('Bearer '):
+            return 401, {'error': {'type': 'AUTHENTICATION_REQUIRED'}}, {}
+        if len(parts) < 3 or parts[0] != 'v0':
+            return 404, {'error': {'type': 'NOT_FOUND'}}, {}
+        base_id, table_name, rest = parts[1], parts[2], parts[3:]
+
+        if not self._admit(base_id):
+            return 429, {'errors': [{'error': 'RATE_LIMIT_REACHED'}]}, {'Retry-After': str(self.retry_after)}
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+
+        try:
+            with self._lock:
+                table = self.tables.get((base_id, table_name))
+                if table is None:
+                    raise AirtableError(404, 'TABLE_NOT_FOUND', table_name)
+                operation, status, payload = self._route(method, table, rest, query, body)
+                self.requests[(table_name, operation)] += 1
+            return status, payload, {}
+        except AirtableError as e:
+            return e.status, {'error': {'type': e.error_type, 'message': str(e)}}, {}
+
+    def _admit(self, base_id):
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(base_id, deque())
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if self.rate and len(window) >= self.rate:
+                self.throttled += 1
+                return False
+            window.append(now)
+            return True
+
+    def _route(self, method, table, rest, query, body):
+        if method == 'GET' and not rest:
+            options = {key.rstrip('[]'): values if key.endswith('[]') else values[0]
+                       for key, values in query.items()}
+            return ('list', 200) + (self._list(table, options),)
+        if method == 'POST' and rest == ['listRecords']:
+            return ('list', 200) + (self._list(table, body),)
+        if method == 'GET' and len(rest) == 1:
+            return 'get', 200, self._public(self._find(table, rest[0]))
+        if method == 'POST' and not rest:
+            return ('create', 200) + (self._create(table, body),)
+        if method in ('PATCH', 'PUT') and not rest:
+            if 'performUpsert' in body:
+                return ('upsert', 200) + (self._upsert(table, body, replace=method == 'PUT'),)
+            return ('update', 200) + (self._update(table, body, replace=method == 'PUT'),)
+        if method in ('PATCH', 'PUT') and len(rest) == 1:
+            record = self._update_one(table, rest[0], body.get('fields', {}), replace=method == 'PUT')
+            return 'update', 200, self._public(record)
+        if method == 'DELETE' and not rest:
+            record_ids = query.get('records[]', [])
+            self._check_batch(record_ids)
+            for record_id in record_ids:
+                self._find(table, record_id)
+            for record_id in record_ids:
+                del table[record_id]
+            return 'delete', 200, {'records': [{'id': r, 'deleted': True} for r in record_ids]}
+        if method == 'DELETE' and len(rest) == 1:
+            self._find(table, rest[0])
+            del table[rest[0]]
+            return 'delete', 200, {'id': rest[0], 'deleted': True}
+        raise AirtableError(404, 'NOT_FOUND', f"{method} {'/'.join(rest)}")
+
+    def _list(self, table, options):
+        page_size = int(options.get('pageSize', MAX_PAGE_SIZE))
+        if page_size > MAX_PAGE_SIZE:
+            raise AirtableError(422, 'INVALID_REQUEST_UNKNOWN', f"pageSize is limited to {MAX_PAGE_SIZE}")
+        # Like Airtable, a listing matches its records once and pages through
+        # that snapshot with an opaque offset, so writes between pages never
+        # shift it. Records deleted since are skipped; the rest read current.
+        if options.get('offset'):
+            if options['offset'] not in self._offsets:
+                raise AirtableError(422, 'LIST_RECORDS_ITERATOR_NOT_AVAILABLE', options['offset'])
+            record_ids, start = self._offsets.pop(options['offset'])
+        else:
+            records = list(table.values())
+            if options.get('filterByFormula'):
+                predicate = compile_formula(options['filterByFormula'])
+                records = [r for r in records if predicate(r)]
+            if options.get('maxRecords'):
+                records = records[:int(options['maxRecords'])]
+            record_ids, start = [r['id'] for r in records], 0
+
+        page = [table[r] for r in record_ids[start:start + page_size] if r in table]
+        fields = options.get('fields')
+        if isinstance(fields, str):
+            fields = [fields]
+        payload = {'records': [self._public(r, fields) for r in page]}
+        if start + page_size < len(record_ids):
+            offset = f"itr{next(self._iterators):014d}/{record_ids[start + page_size]}"
+            self._offsets[offset] = (record_ids, start + page_size)
+            payload['offset'] = offset
+        return payload
+
+    def _create(self, table, body):
+        if 'records' not in body:
+            record = self._new_record(body.get('fields', {}))
+            table[record['id']] = record
+            return self._public(record)
+        self._check_batch(body['records'])
+        records = [self._new_record(r.get('fields', {})) for r in body['records']]
+        for record in records:
+            table[record['id']] = record
+        return {'records': [self._public(r) for r in records]}
+
+    def _update(self, table, body, replace=False):
+        self._check_batch(body.get('records', []))
+        for item in body['records']:
+            self._find(table, item['id'])
+        return {'records': [self._public(self._update_one(table, item['id'], item.get('fields', {}), replace))
+                            for item in body['records']]}
+
+    def _upsert(self, table, body, replace=False):
+        self._check_batch(body.get('records', []))
+        key_fields = body['performUpsert']['fieldsToMergeOn']
+        result = {'records': [], 'createdRecords': [], 'updatedRecords': []}
+        for item in body['records']:
+            fields = item.get('fields', {})
+            matches = [r for r in table.values()
+                       if all(r['fields'].get(k) == fields.get(k) for k in key_fields)]
+            if len(matches) > 1:
+                raise AirtableError(422, 'INVALID_VALUE_FOR_COLUMN',
+                                    'More than one record matches the fields to merge on')
+            if matches:
+                record = self._update_one(table, matches[0]['id'], fields, replace)
+                result['updatedRecords'].append(record['id'])
+            else:
+                record = self._new_record(fields)
+                table[record['id']] = record
+                result['createdRecords'].append(record['id'])
+            result['records'].append(self._public(record))
+        return result
+
+    def _update_one(self, table, record_id, fields, replace=False):
+        record = self._find(table, record_id)
+        record['fields'] = dict(fields) if replace else {**record['fields'], **fields}
+        record['modified'] = time.time()
+        return record
+
+    def _find(self, table, record_id):
+        if record_id not in table:
+            raise AirtableError(404, 'NOT_FOUND', f"Record {record_id} not found")
+        return table[record_id]
+
+    def _check_batch(self, items):
+        if len(items) > MAX_RECORDS_PER_REQUEST:
+            raise AirtableError(422, 'INVALID_RECORDS',
+                                f"At most {MAX_RECORDS_PER_REQUEST} records per request")
+
+    def _new_record(self, fields):
+        now = time.time()
+        return {
+            'id': f"rec{next(self._ids):014d}",
+            'createdTime': datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'modified': now,
+            # Airtable drops empty values
+            'fields': {k: v for k, v in fields.items() if v not in (None, '', [])}
+        }
+
+    def _public(self, record, fields=None):
+        values = record['fields']
+        if fields:
+            values = {k: v for k, v in values.items() if k in fields}
+        return {'id': record['id'], 'createdTime': record['createdTime'], 'fields': dict(values)}
+
+
+_FORMULA_TOKEN = re.compile(r"""\s*(?:(\{[^}]*\})|('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(\d+(?:\.\d+)?)"""
+                            r"""|([A-Za-z_][A-Za-z_0-9]*)|(!=|<=|>=|[=<>(),&]))""")
+
+
+def compile_formula(formula):
+    """Parse the subset of Airtable formulas this repo sends.
+
+    Supports field references, string and number literals, = != < > <= >=,
+    & and OR, AND, NOT, RECORD_ID, CREATED_TIME, LAST_MODIFIED_TIME,
+    DATETIME_PARSE, IS_AFTER, IS_BEFORE, LOWER, UPPER, LEN, TRUE and FALSE.
+    Returns a predicate taking a stored record.
+    """
+    tokens = []
+    position = 0
+    while position < len(formula.rstrip()):
+        match = _FORMULA_TOKEN.match(formula, position)
+        if not match:
+            raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', formula)
+        tokens.append(match.groups())
+        position = match.end()
+    tokens.append((None,) * 5)
+    expression, index = _parse_comparison(tokens, 0, formula)
+    if tokens[index][4] is not None or any(tokens[index][:4]):
+        raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', formula)
+    return lambda record: _truthy(expression(record))
+
+
+def _parse_comparison(tokens, index, formula):
+    left, index = _parse_concat(tokens, index, formula)
+    operator = tokens[index][4]
+    if operator in ('=', '!=', '<', '>', '<=', '>='):
+        right, index = _parse_concat(tokens, index + 1, formula)
+        return (lambda record, l=left, r=right: _compare(operator, l(record), r(record))), index
+    return left, index
+
+
+def _parse_concat(tokens, index, formula):
+    parts = []
+    part, index = _parse_primary(tokens, index, formula)
+    parts.append(part)
+    while tokens[index][4] == '&':
+        part, index = _parse_primary(tokens, index + 1, formula)
+        parts.append(part)
+    if len(parts) == 1:
+        return parts[0], index
+    return (lambda record: ''.join(_text(p(record)) for p in parts)), index
+
+
+def _parse_primary(tokens, index, formula):
+    field, string, number, name, symbol = tokens[index]
+    if field:
+        return (lambda record: record['fields'].get(field[1:-1])), index + 1
+    if string:
+        value = re.sub(r'\\(.)', r'\1', string[1:-1])
+        return (lambda record: value), index + 1
+    if number:
+        value = float(number)
+        return (lambda record: value), index + 1
+    if symbol == '(':
+        expression, index = _parse_comparison(tokens, index + 1, formula)
+        if tokens[index][4] != ')':
+            raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', formula)
+        return expression, index + 1
+    if name and tokens[index + 1][4] == '(':
+        args = []
+        index += 2
+        if tokens[index][4] == ')':
+            index += 1
+        else:
+            while True:
+                arg, index = _parse_comparison(tokens, index, formula)
+                args.append(arg)
+                if tokens[index][4] == ',':
+                    index += 1
+                elif tokens[index][4] == ')':
+                    index += 1
+                    break
+                else:
+                    raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', formula)
+        function = _FORMULA_FUNCTIONS.get(name.upper())
+        if function is None:
+            raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', f"Unknown function {name}")
+        return (lambda record: function(record, *[a(record) for a in args])), index
+    if name and name.upper() in ('TRUE', 'FALSE'):
+        value = name.upper() == 'TRUE'
+        return (lambda record: value), index + 1
+    raise AirtableError(422, 'INVALID_FILTER_BY_FORMULA', formula)
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _truthy(value):
+    return value not in (None, '', 0, False, [])
+
+
+def _compare(operator, left, right):
+    # Airtable compares blanks as empty strings and numbers numerically
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        pass
+    elif isinstance(left, datetime) and isinstance(right, datetime):
+        pass
+    else:
+        left, right = _text(left), _text(right)
+    return {
+        '=': left == right, '!=': left != right, '<': left < right,
+        '>': left > right, '<=': left <= right, '>=': left >= right
+    }[operator]
+
+
+def _parse_datetime(record, text):
+    return datetime.fromisoformat(_text(text).replace('Z', '+00:00'))
+
+
+_FORMULA_FUNCTIONS = {
+    'OR': lambda record, *args: any(_truthy(a) for a in args),
+    'AND': lambda record, *args: all(_truthy(a) for a in args),
+    'NOT': lambda record, value: not _truthy(value),
+    'RECORD_ID': lambda record: record['id'],
+    'CREATED_TIME': lambda record: _parse_datetime(record, record['createdTime']),
+    'LAST_MODIFIED_TIME': lambda record: datetime.fromtimestamp(record['modified'], timezone.utc),
+    'DATETIME_PARSE': _parse_datetime,
+    'IS_AFTER': lambda record, a, b: a > b,
+    'IS_BEFORE': lambda record, a, b: a < b,
+    'LOWER': lambda record, value: _text(value).lower(),
+    'UPPER': lambda record, value: _text(value).upper(),
+    'LEN': lambda record, value: len(_text(value)),
+}
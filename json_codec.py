@@ -0,0 +1,49 @@
+import base64
+import json
+import zlib
+
+# Stored inside every encoded payload; bump when the profile layout changes
+SCHEMA_VERSION = 1
+
+# Payloads longer than this are zlib+base64 wrapped when that is smaller.
+# Airtable's Long text field holds at most 100,000 characters.
+COMPRESS_THRESHOLD = 20000
+ENVELOPE_PREFIX = 'z1:'
+
+
+def encode_profile(data, compress_threshold=COMPRESS_THRESHOLD):
+    """Serialize a profile for the Compressed JSON field.
+
+    Output is compact JSON with a ``v`` schema version. Large payloads are
+    stored as ``z1:`` + base64(zlib(json)) when that is shorter.
+    """
+    text = json.dumps({'v': SCHEMA_VERSION, **data}, separators=(',', ':'), ensure_ascii=False)
+    if compress_threshold is not None and len(text) > compress_threshold:
+        packed = ENVELOPE_PREFIX + base64.b64encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii')
+        if len(packed) < len(text):
+            return packed
+    return text
+
+
+def decode_profile(text):
+    """Parse any Compressed JSON payload: enveloped, compact or legacy pretty-printed.
+
+    Raises ValueError for unreadable payloads or a newer schema version.
+    """
+    if text.startswith(ENVELOPE_PREFIX):
+        try:
+            text = zlib.decompress(base64.b64decode(text[len(ENVELOPE_PREFIX):])).decode('utf-8')
+        except (ValueError, zlib.error) as e:
+            raise ValueError(f"Corrupt compressed payload: {e}") from e
+
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("Compressed JSON must be an object")
+
+    # Legacy payloads carry no version and are treated as version 1
+    version = data.pop('v', 1)
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ValueError(f"Invalid Compressed JSON version: {version!r}")
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported Compressed JSON version: {version}")
+    return data
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from json_codec import decode_profile
+from metrics import get_metrics
+
+DEFAULT_CACHE_PATH = '.llm_cache.sqlite'
+
+# Expired entries are swept, and the entry count re-read, once per this many puts
+SWEEP_EVERY = 1000
+
+
+def cache_key(compressed_json, prompt_version, model_name):
+    # Normalize so encoding, whitespace and key order never cause a cache miss
+    try:
+        normalized = json.dumps(decode_profile(compressed_json), sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        normalized = compressed_json.strip()
+    digest = hashlib.sha256()
+    for part in (normalized, str(prompt_version), model_name):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """Local SQLite store of LLM results keyed by profile content.
+
+    Entries expire after ``ttl_seconds`` and the least recently used ones
+    are evicted once more than ``max_entries`` are stored. The entry count
+    is tracked in memory, so a put only deletes the overflow. A ``read_only``
+    cache only serves lookups: ``put`` stores nothing and hits do not
+    touch ``last_used``. Pass ``':memory:'`` for a throwaway cache.
+    """
+
+    def __init__(self, path=None, max_entries=50000, ttl_seconds=30 * 24 * 3600, read_only=False):
+        self.path = path or os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_results (
+                key TEXT PRIMARY KEY,
+                applicant_id TEXT,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_results_applicant ON llm_results (applicant_id)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_results_created ON llm_results (created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_results_last_used ON llm_results (last_used)")
+        self._conn.commit()
+        self._puts = 0
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created FROM llm_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                get_metrics().inc('llm_cache_lookups_total', result='miss')
+                return None
+            if not self.read_only:
+                self._conn.execute("UPDATE llm_results SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+            get_metrics().inc('llm_cache_lookups_total', result='hit')
+            return json.loads(row[0])
+
+    def put(self, key, result, applicant_id=None):
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM llm_results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_results (key, applicant_id, result, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, applicant_id, json.dumps(result), now, now)
+            )
+            self._entries += not exists
+            self._puts += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def contains_applicant(self, applicant_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM llm_results WHERE applicant_id = ? LIMIT 1", (applicant_id,)
+            ).fetchone()
+        return row is not None
+
+    def _evict(self, now):
+        if self._puts % SWEEP_EVERY == 0:
+            if self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_results WHERE created < ?", (now - self.ttl_seconds,))
+            # Other processes may share the file, so re-read the count now and then
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+        overflow = self._entries - self.max_entries if self.max_entries else 0
+        if overflow > 0:
+            self._entries -= self._conn.execute("""
+                DELETE FROM llm_results WHERE key IN (
+                    SELECT key FROM llm_results ORDER BY last_used LIMIT ?
+                )
+            """, (overflow,)).rowcount
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': entries
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
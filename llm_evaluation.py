@@ -1,100 +1,353 @@
 import os
-from pyairtable import Api
+import sys
+from request_scheduler import create_api
 from dotenv import load_dotenv
 import json
 import google.generativeai as genai
-import time
 import re
+from llm_cache import LLMCache, cache_key
+from llm_pool import LLMWorkerPool
+from batch_writer import BatchWriter
+from record_context import ApplicantContext
+from page_stream import chunked
+from metrics import get_metrics, timed
+from prompt_builder import PromptBuilder, estimate_tokens, INSTRUCTIONS
+
+# Bump when the prompt changes so cached results are re-evaluated
+PROMPT_VERSION = '2'
+MODEL_NAME = 'gemini-1.5-flash'
+
+# Prompt-token budget and applicant cap for one batched Gemini request
+DEFAULT_BATCH_TOKENS = 8000
+DEFAULT_BATCH_SIZE = 10
+
+# Applicants fields this stage reads
+APPLICANT_FIELDS = ['Applicant ID', 'Compressed JSON', 'LLM Summary', 'LLM Score', 'LLM Follow-Ups']
 
 class LLMEvaluator:
-    def __init__(self):
-        self.api = Api(os.getenv('AIRTABLE_API_KEY'))
+    def __init__(self, cache=None, pool=None, model=None, writer=None, api=None):
+        self.api = api or create_api()
         self.base_id = os.getenv('AIRTABLE_BASE_ID')
         
         # Configure Gemini
         genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-        self.model = genai.GenerativeModel('gemini-1.5-flash')  # Free model
+        self.model = model or genai.GenerativeModel(MODEL_NAME)  # Free model
         
-    def evaluate_applicant(self, applicant_id, max_retries=3):
-        # Get compressed JSON
-        applicants = self.api.table(self.base_id, 'Applicants')
-        records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
+        # Compact per-applicant prompts; the instructions live in the model
+        self.prompts = PromptBuilder()
         
-        if not records:
-            print(f"No applicant found: {applicant_id}")
-            return False
+        # Every Gemini call goes through the adaptive-concurrency pool
+        self.pool = pool or LLMWorkerPool()
+        
+        # Results keyed by profile content, prompt version and model
+        self.cache = cache or LLMCache()
+        
+        # Writes are buffered; a shared writer is flushed by its owner
+        self.writer = writer or BatchWriter(self.api, self.base_id)
+        self.owns_writer = writer is None
+        
+    @property
+    def cache_model_name(self):
+        # Model name in cache keys; injected models such as FakeGeminiModel
+        # carry their own, so their results never land under Gemini's keys
+        name = getattr(self.model, 'model_name', None) or type(self.model).__name__
+        return name.removeprefix('models/')
+        
+    @timed('llm')
+    def evaluate_applicant(self, applicant_id, max_retries=3, force=False, deadline=None, context=None):
+        # A run context already holds the record; otherwise fetch it
+        standalone = context is None
+        if standalone:
+            applicants = self.api.table(self.base_id, 'Applicants')
+            records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'", fields=APPLICANT_FIELDS)
             
-        record = records[0]
-        compressed_json = record['fields'].get('Compressed JSON')
+            if not records:
+                print(f"No applicant found: {applicant_id}")
+                return False
+            context = ApplicantContext(records[0])
+            
+        success = self._evaluate(applicant_id, context, max_retries, force, deadline)
+        
+        if standalone:
+            context.commit(self.writer)
+        if self.owns_writer:
+            self.writer.flush()
+        return success
+        
+    def _evaluate(self, applicant_id, context, max_retries, force, deadline):
+        compressed_json = context.compressed_json
         
         if not compressed_json:
             print(f"No JSON data for applicant: {applicant_id}")
             return False
             
-        # Check if we already processed this data
-        current_summary = record['fields'].get('LLM Summary', '')
-        if current_summary:
-            # Skip if already processed and JSON hasn't changed
-            print(f"Already processed applicant: {applicant_id}")
+        # Check if we already processed this exact data
+        key = cache_key(compressed_json, PROMPT_VERSION, self.cache_model_name)
+        if not force and self.use_cached_result(applicant_id, context, key):
+            return True
+            
+        # Call LLM; the pool retries with jittered backoff until the deadline.
+        # max_retries counts attempts here, as it always has; the pool counts retries
+        try:
+            result = self.pool.call(self.call_llm, compressed_json,
+                                    deadline=deadline, max_retries=max(0, max_retries - 1))
+        except Exception as e:
+            print(f"Failed to process applicant {applicant_id}: {str(e)}")
+            return False
+            
+        if not result:
+            print(f"Gemini returned no result for applicant: {applicant_id}")
+            return False
+            
+        self.cache.put(key, result, applicant_id)
+        
+        # Update Airtable with results
+        context.update(self.result_fields(result))
+        return True
+        
+    def evaluate_many(self, applicant_ids, deadline_seconds=None):
+        # Evaluate applicants on the pool's threads; returns {applicant_id: success}
+        results = self.pool.map(
+            lambda applicant_id, deadline: self.evaluate_applicant(applicant_id, deadline=deadline),
+            applicant_ids,
+            deadline_seconds=deadline_seconds
+        )
+        return {a: r is True for a, r in results.items()}
+        
+    @timed('llm_batched')
+    def evaluate_applicants(self, applicant_ids, max_batch_tokens=DEFAULT_BATCH_TOKENS,
+                            max_batch_size=DEFAULT_BATCH_SIZE, contexts=None, force=False):
+        # Batched mode: several profiles per Gemini request; returns {applicant_id: success}
+        standalone = contexts is None
+        if standalone:
+            contexts = {
+                applicant_id: ApplicantContext(record)
+                for applicant_id, record in self.fetch_applicant_records(applicant_ids).items()
+            }
+        results = {}
+        pending = []
+        
+        for applicant_id in applicant_ids:
+            context = contexts.get(applicant_id)
+            if not context:
+                print(f"No applicant found: {applicant_id}")
+                results[applicant_id] = False
+                continue
+                
+            compressed_json = context.compressed_json
+            if not compressed_json:
+                print(f"No JSON data for applicant: {applicant_id}")
+                results[applicant_id] = False
+                continue
+                
+            key = cache_key(compressed_json, PROMPT_VERSION, self.cache_model_name)
+            if not force and self.use_cached_result(applicant_id, context, key):
+                results[applicant_id] = True
+                continue
+            pending.append((applicant_id, context, key, compressed_json))
+            
+        # Batches, then the single-applicant fallbacks, run on the pool's
+        # threads so its adaptive limit decides how many are in flight
+        batches = list(self.pack_batches(pending, max_batch_tokens, max_batch_size))
+        responses = self.pool.map(
+            lambda i, deadline: self.pool.call(self.call_llm_batch, [(item[0], item[3]) for item in batches[i]],
+                                               deadline=deadline),
+            range(len(batches))
+        )
+        fallbacks = {}
+        for i, batch in enumerate(batches):
+            parsed = responses[i]
+            if isinstance(parsed, Exception):
+                print(f"Batched Gemini call failed: {str(parsed)}")
+                parsed = {}
+            for applicant_id, context, key, compressed_json in batch:
+                result = parsed.get(applicant_id)
+                if result is None:
+                    # Entry missing or invalid: fall back to a single-applicant call
+                    print(f"Falling back to single evaluation for {applicant_id}")
+                    fallbacks[applicant_id] = (context, key, compressed_json)
+                    continue
+                self.cache.put(key, result, applicant_id)
+                context.update(self.result_fields(result))
+                results[applicant_id] = True
+                
+        singles = self.pool.map(
+            lambda applicant_id, deadline: self.pool.call(self.call_llm, fallbacks[applicant_id][2],
+                                                          deadline=deadline),
+            list(fallbacks)
+        )
+        for applicant_id, result in singles.items():
+            context, key, _ = fallbacks[applicant_id]
+            if isinstance(result, Exception):
+                print(f"Failed to process applicant {applicant_id}: {str(result)}")
+                result = None
+            if not result:
+                results[applicant_id] = False
+                continue
+            self.cache.put(key, result, applicant_id)
+            context.update(self.result_fields(result))
+            results[applicant_id] = True
+            
+        if standalone:
+            for context in contexts.values():
+                context.commit(self.writer)
+        if self.owns_writer:
+            self.writer.flush()
+        return results
+        
+    def fetch_applicant_records(self, applicant_ids, chunk_size=50):
+        applicants = self.api.table(self.base_id, 'Applicants')
+        fields = APPLICANT_FIELDS
+        records = {}
+        for chunk in chunked(applicant_ids, chunk_size):
+            formula = "OR(" + ", ".join(f"{{Applicant ID}} = '{a}'" for a in chunk) + ")"
+            for record in applicants.all(formula=formula, fields=fields):
+                records.setdefault(record['fields'].get('Applicant ID'), record)
+        return records
+        
+    def use_cached_result(self, applicant_id, context, key):
+        # True when no Gemini call is needed for this applicant
+        current_summary = context.fields.get('LLM Summary', '')
+        cached = self.cache.get(key)
+        
+        if cached:
+            if current_summary == cached['summary']:
+                print(f"Already processed applicant: {applicant_id}")
+            else:
+                # Same profile was scored before; restore without calling Gemini
+                context.update(self.result_fields(cached))
             return True
             
-        # Call LLM with retries
-        for attempt in range(max_retries):
-            try:
-                result = self.call_llm(compressed_json)
-                if result:
-                    # Update Airtable with results
-                    applicants.update(record['id'], {
-                        'LLM Summary': result['summary'],
-                        'LLM Score': result['score'],
-                        'LLM Follow-Ups': result['follow_ups']
-                    })
-                    return True
-                    
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    # Exponential backoff
-                    time.sleep(2 ** attempt)
-                    
-        print(f"Failed to process applicant after {max_retries} attempts")
         return False
         
-    def call_llm(self, json_data):
-        prompt = f"""You are a recruiting analyst. Given this JSON applicant profile, do four things:
-
-1. Provide a concise 75-word summary.
-2. Rate overall candidate quality from 1-10 (higher is better).
-3. List any data gaps or inconsistencies you notice.
-4. Suggest up to three follow-up questions to clarify gaps.
+    def backfill_cache(self):
+        """Adopt the results already stored in Airtable as cache entries.
 
-Applicant Data:
-{json_data}
-
-Return exactly in this format:
-Summary: <text>
-Score: <integer>
-Issues: <comma-separated list or 'None'>
-Follow-Ups: <bullet list>"""
-
-        try:
-            # Generate content with Gemini
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=500,
-                    temperature=0.3,
-                )
-            )
+        One-time step for applicants scored before the cache existed, so the
+        first cached run does not re-score all of them. Only run it while
+        every stored result still matches its Compressed JSON, e.g. right
+        after a full run. Returns the number of entries added.
+        """
+        applicants = self.api.table(self.base_id, 'Applicants')
+        added = 0
+        for page in applicants.iterate(formula="AND({LLM Summary} != '', {Compressed JSON} != '')",
+                                       fields=APPLICANT_FIELDS):
+            for record in page:
+                fields = record['fields']
+                applicant_id = fields.get('Applicant ID')
+                if not applicant_id or self.cache.contains_applicant(applicant_id):
+                    continue
+                self.cache.put(cache_key(fields['Compressed JSON'], PROMPT_VERSION, MODEL_NAME), {
+                    'summary': fields['LLM Summary'],
+                    'score': fields.get('LLM Score', 0),
+                    'follow_ups': fields.get('LLM Follow-Ups', '')
+                }, applicant_id)
+                added += 1
+        return added
+        
+    def pack_batches(self, pending, max_batch_tokens, max_batch_size):
+        batch = []
+        prefix_tokens = estimate_tokens(INSTRUCTIONS['batch'])
+        batch_tokens = prefix_tokens
+        for item in pending:
+            tokens = self.prompts.profile_tokens(item[3])
+            if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+                yield batch
+                batch = []
+                batch_tokens = prefix_tokens
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            yield batch
             
-            if response.text:
-                return self.parse_llm_response(response.text)
-            else:
-                print("Gemini returned empty response")
-                return None
+    def call_llm_batch(self, profiles):
+        # profiles: [(applicant_id, compressed_json), ...] -> {applicant_id: result}
+        response = self.generate(
+            'batch',
+            self.prompts.batch(profiles),
+            genai.types.GenerationConfig(
+                max_output_tokens=400 * len(profiles),
+                temperature=0.3,
+                response_mime_type='application/json',
+            )
+        )
+        return self.parse_batch_response(response.text, [p[0] for p in profiles])
+        
+    def parse_batch_response(self, content, expected_ids):
+        # Keep only well-formed entries for applicants we asked about
+        content = (content or '').strip()
+        if content.startswith('```'):
+            content = content.strip('`').removeprefix('json').strip()
+        try:
+            entries = json.loads(content)
+        except json.JSONDecodeError:
+            print("Batched Gemini response was not valid JSON")
+            return {}
+        if not isinstance(entries, list):
+            return {}
             
-        except Exception as e:
-            print(f"Gemini API error: {str(e)}")
+        expected = set(expected_ids)
+        results = {}
+        for entry in entries:
+            if not isinstance(entry, dict) or entry.get('applicant_id') not in expected:
+                continue
+            summary = entry.get('summary')
+            try:
+                score = int(entry.get('score'))
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(summary, str) or not summary.strip() or not 1 <= score <= 10:
+                continue
+                
+            issues = entry.get('issues') or 'None'
+            if isinstance(issues, list):
+                issues = ', '.join(str(i) for i in issues) or 'None'
+            follow_ups = entry.get('follow_ups') or 'No follow-ups suggested'
+            if isinstance(follow_ups, list):
+                follow_ups = '\n'.join(f"- {q}" for q in follow_ups) or 'No follow-ups suggested'
+                
+            results[entry['applicant_id']] = {
+                'summary': summary.strip(),
+                'score': score,
+                'issues': str(issues),
+                'follow_ups': str(follow_ups)
+            }
+        return results
+        
+    def result_fields(self, result):
+        return {
+            'LLM Summary': result['summary'],
+            'LLM Score': result['score'],
+            'LLM Follow-Ups': result['follow_ups']
+        }
+        
+    def generate(self, kind, body, generation_config):
+        # A Gemini model gets the instructions as a per-kind system
+        # instruction; any other model gets them inline
+        model = self.model
+        if isinstance(model, genai.GenerativeModel):
+            model = self.prompts.model_for(kind, model.model_name)
+        else:
+            body = INSTRUCTIONS[kind] + '\n\n' + body
+        response = model.generate_content(body, generation_config=generation_config)
+        record_token_usage(response)
+        return response
+        
+    def call_llm(self, compressed_json):
+        # API errors propagate so the worker pool can back off and retry
+        response = self.generate(
+            'single',
+            self.prompts.single(compressed_json),
+            genai.types.GenerationConfig(
+                max_output_tokens=500,
+                temperature=0.3,
+            )
+        )
+        
+        if response.text:
+            return self.parse_llm_response(response.text)
+        else:
+            print("Gemini returned empty response")
             return None
             
     def parse_llm_response(self, content):
@@ -121,9 +374,23 @@ Follow-Ups: <bullet list>"""
                 'follow_ups': "Unable to generate follow-ups"
             }
 
+def record_token_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        metrics = get_metrics()
+        metrics.inc('llm_tokens_total', usage.prompt_token_count or 0, kind='prompt')
+        metrics.inc('llm_tokens_total', usage.candidates_token_count or 0, kind='output')
+        metrics.inc('llm_tokens_total', getattr(usage, 'cached_content_token_count', 0) or 0, kind='cached')
+
 # Usage
 if __name__ == "__main__":
     load_dotenv()
     evaluator = LLMEvaluator()
+    
+    # One-off, after upgrading: python llm_evaluation.py --backfill-cache
+    if '--backfill-cache' in sys.argv:
+        print(f"Cached {evaluator.backfill_cache()} stored results")
+        sys.exit(0)
+        
     success = evaluator.evaluate_applicant("002")
     print(f"LLM evaluation {'successful' if success else 'failed'}")
\ No newline at end of file
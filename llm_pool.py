@@ -0,0 +1,206 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+
+from metrics import get_metrics
+
+# HTTP statuses worth retrying; 429/503 also mean "send less"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+class LLMDeadlineExceeded(Exception):
+    pass
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight Gemini requests.
+
+    Every fast success raises the limit by about one request per window of
+    completed calls; a 429/5xx or a call slower than ``target_latency``
+    cuts it by ``decrease_factor`` (at most once per ``cooldown`` seconds, so
+    a burst of failures from the same window only counts once).
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16, target_latency=10.0,
+                 decrease_factor=0.5, cooldown=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, congested=False):
+        with self._cond:
+            self.in_flight -= 1
+            if congested or (latency is not None and latency > self.target_latency):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class LLMWorkerPool:
+    """Runs Gemini calls under an adaptive concurrency limit with retries.
+
+    ``call`` blocks the calling thread until the request succeeds, fails
+    permanently, runs out of retries or passes its deadline. Retryable
+    errors are backed off with full jitter, or for the server's suggested
+    delay when the error carries one. ``map`` fans a function out over many
+    items on the pool's own threads.
+    """
+
+    def __init__(self, max_workers=16, initial_concurrency=2, target_latency=10.0,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_workers = max_workers
+        self.limiter = AdaptiveLimiter(initial=initial_concurrency, maximum=max_workers,
+                                       target_latency=target_latency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # Optional SharedBudget: caps Gemini requests across worker processes
+        self.budget = None
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def call(self, fn, *args, deadline=None, max_retries=None, **kwargs):
+        # deadline is an absolute time.monotonic() value
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and (timeout <= 0 or not self.limiter.acquire(timeout)):
+                self._count('failures')
+                raise LLMDeadlineExceeded("Deadline passed while waiting for an LLM slot")
+            if timeout is None:
+                self.limiter.acquire()
+
+            if self.budget is not None:
+                self.budget.acquire('gemini')
+
+            started = time.monotonic()
+            try:
+                self._count('calls')
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = status_code(e) in THROTTLE_STATUSES
+                self.limiter.release(congested=throttled or status_code(e) in RETRYABLE_STATUSES)
+                if throttled:
+                    self._count('throttled')
+                if not is_retryable(e) or attempt == max_retries:
+                    self._count('failures')
+                    raise
+
+                delay = backoff_delay(attempt, e, self.base_delay, self.max_delay)
+                if throttled and self.budget is not None:
+                    self.budget.pause('gemini', delay)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self._count('failures')
+                    raise LLMDeadlineExceeded(f"Deadline would pass before retrying: {e}") from e
+                print(f"LLM attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                self._count('retries')
+                time.sleep(delay)
+                continue
+
+            self.limiter.release(latency=time.monotonic() - started)
+            return result
+
+    def map(self, fn, items, deadline_seconds=None):
+        # Returns {item: result or exception}; each item gets its own deadline
+        def run(item, deadline):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LLMDeadlineExceeded(f"Deadline passed before {item} started")
+            return fn(item, deadline=deadline)
+
+        submitted = time.monotonic()
+        deadline = None if deadline_seconds is None else submitted + deadline_seconds
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm') as executor:
+            futures = {item: executor.submit(run, item, deadline) for item in items}
+            for item, future in futures.items():
+                try:
+                    results[item] = future.result()
+                except Exception as e:
+                    results[item] = e
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failures': self.failures,
+                'concurrency_limit': round(self.limiter.limit, 2)
+            }
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        get_metrics().inc('llm_requests_total', outcome=name)
+
+
+def status_code(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_retryable(error):
+    if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                          google_exceptions.ServerError, google_exceptions.DeadlineExceeded,
+                          TimeoutError, ConnectionError)):
+        return True
+    return status_code(error) in RETRYABLE_STATUSES
+
+
+def retry_hint(error):
+    # Seconds the server asked us to wait, if it said
+    hint = getattr(error, 'retry_after', None)
+    if hint is not None:
+        return float(hint)
+    for detail in getattr(error, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = re.search(r'retry in ([\d.]+)\s*s', str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, error=None, base_delay=1.0, max_delay=60.0):
+    hint = retry_hint(error) if error is not None else None
+    if hint is not None:
+        # Honour the hint, plus a little jitter so callers don't retry in lockstep
+        return min(max_delay, hint) + random.uniform(0, base_delay)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
@@ -1,71 +1,435 @@
 import os
+import socket
+import time
+import multiprocessing
 from dotenv import load_dotenv
+from request_scheduler import create_api, get_scheduler, SharedBudget
+from work_queue import LeaseQueue, keep_alive
+from batch_writer import BatchWriter
 from compress_data import AirtableCompressor
 from shortlist_candidates import CandidateShortlister
-from llm_evaluation import LLMEvaluator
+from llm_evaluation import LLMEvaluator, PROMPT_VERSION, MODEL_NAME
+from llm_cache import cache_key
+from checkpoint_journal import CheckpointJournal, input_hash
+from child_index import ChildRowIndex
+from pipeline_executor import PipelineExecutor
+from sync_state import SyncState, modified_since_formula
+from page_stream import prefetch, chunked
+from record_context import RunContext, CONTEXT_FIELDS
+from metrics import export_metrics, profiled
+from prompt_builder import print_prompt_stats
+
+# Applicants fields loaded with each page; Compressed JSON is rebuilt anyway
+PAGE_FIELDS = [f for f in CONTEXT_FIELDS if f != 'Compressed JSON']
+
+# Gemini requests per second shared by all worker processes
+DEFAULT_GEMINI_RATE = 1.0
+
+# Applicants fields each stage produces, as stored in the checkpoint journal
+STAGE_FIELDS = {
+    'compress': ['Compressed JSON'],
+    'shortlist': ['Shortlist Status'],
+    'llm': ['LLM Summary', 'LLM Score', 'LLM Follow-Ups']
+}
 
 load_dotenv()
 
 class ApplicationProcessor:
-    def __init__(self):
-        self.compressor = AirtableCompressor()
-        self.shortlister = CandidateShortlister()
-        self.llm_evaluator = LLMEvaluator()
+    def __init__(self, journal=None):
+        self.api = create_api()
+        self.base_id = os.getenv('AIRTABLE_BASE_ID')
+        
+        # One write buffer and one Api shared by every stage
+        self.writer = BatchWriter(self.api, self.base_id)
         
-    def process_applicant(self, applicant_id):
+        # Each Applicants record is loaded once per run and every stage's
+        # writes to it are merged into a single update
+        self.run = RunContext(self.api, self.base_id, self.writer)
+        
+        # Which applicant each child row belongs to, so deleted rows can be traced
+        self.child_rows = ChildRowIndex()
+        self.compressor = AirtableCompressor(writer=self.writer, api=self.api, child_rows=self.child_rows)
+        self.shortlister = CandidateShortlister(writer=self.writer, api=self.api)
+        self.llm_evaluator = LLMEvaluator(writer=self.writer, api=self.api)
+        
+        # Finished stages survive a crash; see resume()
+        self.journal = journal or CheckpointJournal()
+        self.committed = {}  # record ID -> (Applicant ID, all stages succeeded), queued but not yet written
+        self.unfinished = set()  # Applicant IDs this run could not finish
+        
+    def process_applicant(self, applicant_id, data=None):
         print(f"Processing applicant: {applicant_id}")
         
+        if not self.compress_applicant(applicant_id, data):
+            self.run.release(applicant_id)
+            return False
+            
+        # The record's update goes out even if a later stage raises
+        llm_success = False
+        try:
+            self.shortlist_applicant(applicant_id)
+            llm_success = self.evaluate_applicant(applicant_id)
+        finally:
+            self.finish_applicant(applicant_id, complete=llm_success)
+            unfinished = self.flush_writes()
+        if not llm_success:
+            return False
+        if unfinished:
+            print("❌ Failed to save results")
+            return False
+            
+        print(f"Processing complete for {applicant_id}")
+        return True
+        
+    def profile_applicant(self, applicant_id, output=None):
+        # cProfile one applicant's run; prints the top functions, dumps stats to output if given
+        with profiled(output):
+            return self.process_applicant(applicant_id)
+        
+    def finish_applicant(self, applicant_id, complete=True):
+        # Queue the record's merged update and release it from the run.
+        # complete=False: a stage failed, so the journal keeps the applicant
+        # unfinished and the next run's resume() retries it
+        context = self.run.commit(applicant_id)
+        self.shortlister.forget_leads([applicant_id])
+        if context is not None:
+            self.committed[context.record_id] = (applicant_id, complete)
+            
+    def flush_writes(self):
+        # Send queued writes; applicants that finished every stage and whose
+        # update landed are done in the journal. Returns the others.
+        committed, self.committed = self.committed, {}
+        errors = self.writer.flush()
+        
+        failed = {error['record'].get('id') for error in errors if error['table'] == 'Applicants'}
+        finished = {a for record_id, (a, complete) in committed.items() if complete and record_id not in failed}
+        self.journal.mark_done(sorted(finished))
+        unfinished = [a for a, _ in committed.values() if a not in finished]
+        self.unfinished.difference_update(finished)
+        self.unfinished.update(unfinished)
+        return unfinished
+        
+    def restore_stage(self, applicant_id, stage, key):
+        # Re-apply a stage an interrupted run already finished for this input
+        result = self.journal.lookup(applicant_id, stage, key)
+        if result is not None:
+            self.run.get(applicant_id).update(result['fields'])
+        return result
+        
+    def checkpoint_stage(self, applicant_id, stage, key, **extra):
+        context = self.run.get(applicant_id)
+        fields = {f: context.fields[f] for f in STAGE_FIELDS[stage] if context.fields.get(f) is not None}
+        self.journal.record(applicant_id, stage, key, {'fields': fields, **extra})
+        
+    def resume(self):
+        # Finish applicants an interrupted run left behind: finished stages
+        # come from the journal and their lost writes are sent again
+        unfinished = self.journal.unfinished()
+        if not unfinished:
+            return 0
+        print(f"Resuming {len(unfinished)} applicants left unfinished by the last run")
+        for chunk in chunked(unfinished, 100):
+            records = self.find_applicant_records(chunk)
+            found = {record['fields'].get('Applicant ID') for record in records}
+            # Deleted from Airtable since: nothing left to write
+            self.journal.mark_done([a for a in chunk if a not in found])
+            if records:
+                self.process_page(records)
+        return len(unfinished)
+        
+    def compress_applicant(self, applicant_id, data=None):
         # Step 1: Compress data into JSON
-        print("1. Compressing data...")
-        data = self.compressor.get_applicant_data(applicant_id)
-        success = self.compressor.update_applicant_json(applicant_id, data)
+        print(f"1. Compressing data for {applicant_id}...")
+        context = self.run.get(applicant_id)
+        if context is None:
+            print("❌ Failed to compress data")
+            return False
+        if data is None:
+            data = self.compressor.get_applicant_data(applicant_id)
+            
+        self.journal.start(applicant_id, context.record_id)
+        key = input_hash(data)
+        if self.restore_stage(applicant_id, 'compress', key) is not None:
+            print("✅ Data compressed (from checkpoint)")
+            return True
+            
+        success = self.compressor.update_applicant_json(applicant_id, data, context=context)
         
         if not success:
             print("❌ Failed to compress data")
             return False
             
+        self.checkpoint_stage(applicant_id, 'compress', key)
         print("✅ Data compressed successfully")
+        return True
         
+    def shortlist_applicant(self, applicant_id):
         # Step 2: Evaluate for shortlisting
-        print("2. Evaluating for shortlist...")
-        is_shortlisted, reason = self.shortlister.evaluate_candidate(applicant_id)
+        print(f"2. Evaluating {applicant_id} for shortlist...")
+        context = self.run.get(applicant_id)
+        key = input_hash(context.compressed_json or '') if context else None
+        restored = key and self.restore_stage(applicant_id, 'shortlist', key)
+        if restored:
+            is_shortlisted, reason = restored['shortlisted'], restored['reason']
+            if is_shortlisted:
+                # Upsert, so a lead that was already written is left alone
+                self.shortlister.create_shortlisted_lead(applicant_id, context.compressed_json, reason)
+        else:
+            is_shortlisted, reason = self.shortlister.evaluate_candidate(applicant_id, context=context)
+            if context and 'Shortlist Status' in context.pending:
+                self.checkpoint_stage(applicant_id, 'shortlist', key, shortlisted=is_shortlisted, reason=reason)
         
         if is_shortlisted:
             print("✅ Candidate shortlisted!")
         else:
             print("⏸️ Candidate not shortlisted")
         print(f"Reason: {reason}")
+        return is_shortlisted
         
+    def evaluate_applicant(self, applicant_id):
         # Step 3: LLM evaluation
-        print("3. Running LLM evaluation...")
-        llm_success = self.llm_evaluator.evaluate_applicant(applicant_id)
+        print(f"3. Running LLM evaluation for {applicant_id}...")
+        key = self.llm_key(applicant_id)
+        if key and self.restore_stage(applicant_id, 'llm', key) is not None:
+            llm_success = True
+        else:
+            llm_success = self.llm_evaluator.evaluate_applicant(applicant_id, context=self.run.get(applicant_id))
+            if llm_success and key:
+                self.checkpoint_stage(applicant_id, 'llm', key)
         
         if llm_success:
             print("✅ LLM evaluation complete")
         else:
             print("❌ LLM evaluation failed")
+        return llm_success
+        
+    def llm_key(self, applicant_id):
+        context = self.run.get(applicant_id)
+        if context is None or not context.compressed_json:
+            return None
+        return cache_key(context.compressed_json, PROMPT_VERSION, MODEL_NAME)
+        
+    def process_all_applicants(self, concurrency=None, incremental=False, sync_state=None):
+        """Process all applicants who have data but haven't been processed
+        
+        Applicants are streamed a page (100 records) at a time while the next
+        page is prefetched, so memory stays bounded however large the table
+        is. Pass ``concurrency`` (e.g. ``{'compress': 2, 'shortlist': 2, 'llm': 4}``)
+        to run the stages concurrently with PipelineExecutor. With
+        ``incremental=True``, applicants whose Personal Details, Work
+        Experience or Salary Preferences rows changed since the last run's
+        watermark are recompressed too.
+        """
+        if incremental:
+            sync_state = sync_state or SyncState()
+            next_watermark = sync_state.next_watermark()
             
-        print(f"Processing complete for {applicant_id}")
-        return True
+        self.unfinished = set()
+        self.resume()
+        
+        pages = prefetch(self.iter_pending_pages(incremental, sync_state))
+        
+        if concurrency:
+            all_data = {}
+            summary = PipelineExecutor(self, concurrency).run(self.stream_applicants(pages, all_data), all_data)
+        else:
+            summary = {'applicants': 0, 'compressed': 0}
+            for page_number, page in enumerate(pages, 1):
+                compressed = self.process_page(page)
+                summary['applicants'] += len(page)
+                summary['compressed'] += len(compressed)
+                print(f"\nPage {page_number}: processed {len(compressed)} of {len(page)} applicants "
+                      f"({summary['compressed']} of {summary['applicants']} so far)")
+                      
+            print(f"\nProcessed {summary['compressed']} of {summary['applicants']} pending applicants")
+            cache_stats = self.llm_evaluator.cache.stats()
+            print(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+            print_prompt_stats(self.llm_evaluator.prompts)
+            
+        if incremental:
+            # Failed applicants are retried next run: their edits are behind the new watermark
+            sync_state.save(next_watermark, retry=self.unfinished)
+        export_metrics()
+        return summary
+        
+    def iter_pending_pages(self, incremental=False, sync_state=None, page_size=100):
+        # Yields pages of Applicants records (ID field only) that need processing
+        applicants = self.api.table(self.base_id, 'Applicants')
+        
+        # Only applicants without JSON, and only the ID field: no blobs downloaded
+        seen = set()
+        for page in applicants.iterate(formula="{Compressed JSON} = ''", fields=PAGE_FIELDS,
+                                       page_size=page_size):
+            page = [r for r in page if r['fields'].get('Applicant ID')]
+            seen.update(r['fields']['Applicant ID'] for r in page)
+            if page:
+                yield page
+                
+        if not incremental:
+            return
+        watermark = sync_state.load()
+        if not watermark:
+            print("No watermark yet: processing every unprocessed applicant")
+            return
+            
+        changed = self.compressor.get_changed_applicant_ids(modified_since_formula(watermark)) - seen
+        deleted = self.compressor.get_deleted_applicant_ids() - seen - changed
+        retry = set(sync_state.load_retry()) - seen - changed - deleted
+        print(f"{len(changed)} applicants with child-table changes since {watermark}, "
+              f"{len(deleted)} with deleted child rows, {len(retry)} left unfinished by the last run")
+        changed |= deleted | retry
+        for chunk in chunked(sorted(changed), page_size):
+            # Recompressed applicants need their Applicants record IDs too
+            yield self.find_applicant_records(chunk)
+            
+    def stream_applicants(self, pages, all_data):
+        # Feeds PipelineExecutor one page at a time, bulk-loading each page's data
+        for page_number, page in enumerate(pages, 1):
+            applicant_ids = [self.run.add(r).applicant_id for r in page]
+            all_data.update(self.compressor.get_all_applicant_data(applicant_ids))
+            # Existing leads for this page, so unchanged ones are not rewritten
+            self.shortlister.load_leads(applicant_ids)
+            print(f"\nPage {page_number}: queued {len(applicant_ids)} applicants")
+            yield from applicant_ids
+            
+    def process_page(self, page):
+        # Run one page stage by stage. Stages share the page's records in
+        # memory and each applicant's writes go out as one merged update, in
+        # 10-record batches, when the page is done - or when a stage raises,
+        # so finished work is not lost
+        pending = [self.run.add(record).applicant_id for record in page]
+        compressed = []
+        complete = set()
+        try:
+            all_data = self.compressor.get_all_applicant_data(pending)
+            
+            for applicant_id in pending:
+                print(f"\nCompressing applicant: {applicant_id}")
+                if self.compress_applicant(applicant_id, all_data[applicant_id]):
+                    compressed.append(applicant_id)
+                
+            # Existing leads for this page, so unchanged ones are not rewritten
+            self.shortlister.load_leads(compressed)
+            for applicant_id in compressed:
+                print(f"\nShortlisting applicant: {applicant_id}")
+                self.shortlist_applicant(applicant_id)
+            
+            # LLM stage packs several profiles into each Gemini request
+            print(f"\nRunning batched LLM evaluation for {len(compressed)} applicants...")
+            keys = {a: self.llm_key(a) for a in compressed}
+            todo = [a for a in compressed if not (keys[a] and self.restore_stage(a, 'llm', keys[a]))]
+            contexts = {a: self.run.get(a) for a in todo}
+            llm_results = self.llm_evaluator.evaluate_applicants(todo, contexts=contexts)
+            for applicant_id, ok in llm_results.items():
+                if ok and keys[applicant_id]:
+                    self.checkpoint_stage(applicant_id, 'llm', keys[applicant_id])
+            failed_llm = [a for a, ok in llm_results.items() if not ok]
+            if failed_llm:
+                print(f"❌ LLM evaluation failed for: {', '.join(failed_llm)}")
+            
+            complete = set(compressed) - set(failed_llm)
+        finally:
+            for applicant_id in pending:
+                self.finish_applicant(applicant_id, complete=applicant_id in complete)
+            unfinished = set(self.flush_writes())
+        
+        # Applicants with a failed stage or write are left out; the journal
+        # keeps them unfinished for the next run's resume()
+        saved = [a for a in compressed if a not in unfinished]
+        if len(saved) < len(compressed):
+            print(f"❌ {len(compressed) - len(saved)} applicants not finished; the next run retries them")
+        return saved
+            
+    def process_applicants(self, applicant_ids):
+        # Recompress and re-evaluate specific applicants, e.g. from webhook events
+        print(f"\nProcessing {len(applicant_ids)} changed applicants")
+        saved = []
+        for chunk in chunked(sorted(applicant_ids), 100):
+            records = self.find_applicant_records(chunk)
+            if records:
+                saved.extend(self.process_page(records))
+        export_metrics()
+        return saved
+        
+    def enqueue_pending(self, queue, incremental=False, sync_state=None):
+        # Work-queue mode: split pending applicants into leases for run_worker
+        if incremental:
+            sync_state = sync_state or SyncState()
+            next_watermark = sync_state.next_watermark()
+            
+        added = 0
+        for page in self.iter_pending_pages(incremental, sync_state):
+            added += queue.enqueue([r['fields']['Applicant ID'] for r in page])
+        print(f"Queued {added} applicants in {queue.path}: {queue.stats()}")
         
-    def process_all_applicants(self):
-        """Process all applicants who have data but haven't been processed"""
-        from pyairtable import Api
+        if incremental:
+            # Queued applicants, including last run's retries, are the queue's to retry now
+            sync_state.save(next_watermark)
+        return added
         
-        api = Api(os.getenv('AIRTABLE_API_KEY'))
-        applicants = api.table(os.getenv('AIRTABLE_BASE_ID'), 'Applicants')
+    def run_worker(self, queue, worker_id=None, poll_interval=5.0):
+        # Claim leases until none are pending or held by live workers
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
         
-        # Get all applicants
-        records = applicants.all()
+        # Every worker draws from the same Airtable and Gemini budgets
+        budget = SharedBudget(queue.path, rates={'gemini': float(os.getenv('GEMINI_RATE', DEFAULT_GEMINI_RATE))})
+        get_scheduler().budget = budget
+        self.llm_evaluator.pool.budget = budget
         
-        for record in records:
-            applicant_id = record['fields'].get('Applicant ID')
-            compressed_json = record['fields'].get('Compressed JSON')
+        # Applicants an interrupted run left unfinished go back on the queue;
+        # ones still held by a live lease are skipped by enqueue
+        resumed = queue.enqueue(self.journal.unfinished())
+        if resumed:
+            print(f"[{worker_id}] Re-queued {resumed} applicants left unfinished by the last run")
+            
+        processed = 0
+        while True:
+            lease = queue.claim(worker_id)
+            if lease is None:
+                if not queue.remaining():
+                    break
+                # Leases held by other workers may still expire and come back
+                time.sleep(poll_interval)
+                continue
+                
+            print(f"\n[{worker_id}] Lease {lease.lease_id}: {len(lease.applicant_ids)} applicants")
+            try:
+                with keep_alive(queue, lease):
+                    records = self.find_applicant_records(lease.applicant_ids)
+                    saved = self.process_page(records) if records else []
+            except Exception as e:
+                print(f"❌ [{worker_id}] Lease {lease.lease_id} failed: {e}")
+                queue.release(lease)
+                continue
+            # Found but not saved: retried under a new lease with the same attempts
+            found = {record['fields'].get('Applicant ID') for record in records}
+            queue.complete(lease, unfinished=found - set(saved))
+            processed += len(saved)
+            export_metrics()
             
-            if applicant_id and not compressed_json:
-                print(f"\nProcessing unprocessed applicant: {applicant_id}")
-                self.process_applicant(applicant_id)
+        print(f"[{worker_id}] No work left, processed {processed} applicants")
+        return processed
+        
+    def find_applicant_records(self, applicant_ids, chunk_size=50):
+        applicants = self.api.table(self.base_id, 'Applicants')
+        records = []
+        for chunk in chunked(applicant_ids, chunk_size):
+            formula = "OR(" + ", ".join(f"{{Applicant ID}} = '{a}'" for a in chunk) + ")"
+            records.extend(applicants.all(formula=formula, fields=PAGE_FIELDS))
+        return records
 
+def _worker_main(queue_path):
+    ApplicationProcessor().run_worker(LeaseQueue(queue_path))
+    
+def run_workers(count, queue_path=None):
+    # Start count worker processes on this host and wait for them to drain the queue
+    processes = [multiprocessing.Process(target=_worker_main, args=(queue_path,), name=f"worker-{n}")
+                 for n in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        
 # Usage
 if __name__ == "__main__":
     processor = ApplicationProcessor()
@@ -74,4 +438,21 @@ if __name__ == "__main__":
     # processor.process_applicant("APP001")
     
     # Or process all unprocessed applicants
-    processor.process_all_applicants()
\ No newline at end of file
+    processor.process_all_applicants()
+    
+    # Or only pick up applicants whose child rows changed since the last run
+    # processor.process_all_applicants(incremental=True)
+    
+    # Or shard the work across worker processes on this host
+    # processor.enqueue_pending(LeaseQueue())
+    # run_workers(4)
+    
+    # Or profile a single applicant's run
+    # processor.profile_applicant("APP001", output="applicant.prof")
+    
+    # Or react to Airtable webhooks: python webhook_receiver.py 8080
+    
+    # Or see how far an interrupted run got: python checkpoint_journal.py
+    
+    # Or overlap the stages with worker threads
+    # processor.process_all_applicants(concurrency={'compress': 2, 'shortlist': 2, 'llm': 4})
\ No newline at end of file
@@ -0,0 +1,210 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'pipeline_stage_seconds': 'Time spent in one call of a pipeline stage',
+    'airtable_request_seconds': 'Airtable HTTP request latency, including scheduler wait',
+    'airtable_requests_total': 'Airtable HTTP requests by table, method and status',
+    'airtable_throttled_total': 'Airtable responses with status 429 or 503',
+    'airtable_write_retries_total': 'Records replayed one by one after a rejected batch',
+    'llm_requests_total': 'Gemini requests by outcome',
+    'llm_tokens_total': 'Gemini tokens by kind',
+    'llm_prompt_tokens_estimated_total': 'Estimated prompt tokens, legacy prompt vs compact prompt',
+    'llm_cache_lookups_total': 'LLM result cache lookups by result',
+}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Process-wide counters and latency histograms.
+
+    Recording is a dict update under a lock, cheap enough for every Airtable
+    request and stage call. Export with ``prometheus_text()`` (for the
+    node_exporter textfile collector) or ``summary()`` (JSON).
+    """
+
+    def __init__(self):
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name, **labels):
+        # Sum over every label set matching the given labels
+        with self._lock:
+            return sum(value for (n, key), value in self._counters.items()
+                       if n == name and set(labels.items()) <= set(key))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self):
+        with self._lock:
+            counters = [{'name': n, 'labels': dict(key), 'value': v} for (n, key), v in sorted(self._counters.items())]
+            histograms = [{
+                'name': n,
+                'labels': dict(key),
+                'count': h.count,
+                'sum': round(h.sum, 6),
+                'p50': h.quantile(0.5),
+                'p99': h.quantile(0.99)
+            } for (n, key), h in sorted(self._histograms.items())]
+        hits = self.counter('llm_cache_lookups_total', result='hit')
+        lookups = self.counter('llm_cache_lookups_total')
+        return {
+            'counters': counters,
+            'histograms': histograms,
+            'llm_cache_hit_rate': round(hits / lookups, 3) if lookups else 0.0
+        }
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _write_atomic(path, text):
+    # The textfile collector must never see a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def timed(stage):
+    """Decorator recording a method's duration in pipeline_stage_seconds."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with _metrics.timer('pipeline_stage_seconds', stage=stage):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_metrics():
+    # Written when METRICS_TEXTFILE / METRICS_JSON name a destination
+    textfile = os.getenv('METRICS_TEXTFILE')
+    json_path = os.getenv('METRICS_JSON')
+    if textfile:
+        _metrics.write_textfile(textfile)
+    if json_path:
+        _metrics.write_json(json_path)
+
+
+@contextmanager
+def profiled(output=None, sort='cumulative', limit=25):
+    """cProfile the block, print the top ``limit`` functions and optionally dump stats to ``output``."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output:
+            profiler.dump_stats(output)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        print(stream.getvalue())
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+STAGES = ('compress', 'shortlist', 'llm')
+
+# Worker threads per stage; the LLM stage waits longest on the network
+DEFAULT_CONCURRENCY = {'compress': 2, 'shortlist': 2, 'llm': 4}
+
+_DONE = object()
+
+
+class PipelineExecutor:
+    """Runs compress -> shortlist -> LLM for many applicants concurrently.
+
+    Each stage has its own pool of worker threads, and stages are connected
+    by bounded queues, so applicant K+1 can be compressing while applicant K
+    waits on Gemini. An applicant only enters a stage after finishing the
+    previous one, and stops at the first stage that fails: a stage that
+    raises, or a compress or LLM stage that returns False. A candidate who
+    is not shortlisted has not failed and still gets an LLM evaluation.
+    """
+
+    def __init__(self, processor, concurrency=None, queue_size=20):
+        self.processor = processor
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.queue_size = queue_size
+
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def run(self, applicant_ids, all_data=None):
+        if all_data is None:
+            all_data = {}
+        started = time.monotonic()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in STAGES]
+        handlers = {
+            # pop: streamed runs free each applicant's data once it is compressed
+            'compress': lambda a: self._compress(a, all_data.pop(a, None)),
+            'shortlist': self.processor.shortlist_applicant,
+            'llm': self.processor.evaluate_applicant,
+        }
+
+        pools = []
+        for index, stage in enumerate(STAGES):
+            next_queue = queues[index + 1] if index + 1 < len(STAGES) else None
+            workers = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(stage, handlers[stage], queues[index], next_queue),
+                    name=f"{stage}-{n}",
+                    daemon=True
+                )
+                for n in range(self.concurrency[stage])
+            ]
+            for worker in workers:
+                worker.start()
+            pools.append(workers)
+
+        for applicant_id in applicant_ids:
+            with self._lock:
+                self.results[applicant_id] = {}
+            queues[0].put(applicant_id)
+
+        # Shut stages down in order once everything upstream has drained
+        for index, workers in enumerate(pools):
+            for _ in workers:
+                queues[index].put(_DONE)
+            for worker in workers:
+                worker.join()
+
+        # Send whatever is still buffered
+        self.processor.flush_writes()
+
+        summary = self.summary(time.monotonic() - started)
+        self.print_summary(summary)
+        return summary
+
+    def _compress(self, applicant_id, data):
+        # Later stages read the JSON from the run context, so nothing is flushed here
+        return self.processor.compress_applicant(applicant_id, data)
+
+    def _worker(self, stage, handler, in_queue, out_queue):
+        while True:
+            applicant_id = in_queue.get()
+            if applicant_id is _DONE:
+                return
+
+            try:
+                result = handler(applicant_id)
+                # Shortlist returns False for "not shortlisted", which is not a failure
+                ok = stage == 'shortlist' or bool(result)
+            except Exception as e:
+                print(f"❌ {stage} failed for {applicant_id}: {e}")
+                result, ok = None, False
+
+            with self._lock:
+                self.results[applicant_id][stage] = result
+
+            if out_queue is not None and ok:
+                out_queue.put(applicant_id)
+            else:
+                # Leaving the pipeline: queue its merged Applicants update.
+                # Only an applicant that got through the LLM stage is complete
+                self.processor.finish_applicant(applicant_id, complete=ok)
+
+    def summary(self, elapsed):
+        with self._lock:
+            results = list(self.results.values())
+        return {
+            'applicants': len(results),
+            'compressed': sum(1 for r in results if r.get('compress')),
+            'shortlisted': sum(1 for r in results if r.get('shortlist')),
+            'llm_evaluated': sum(1 for r in results if r.get('llm')),
+            'failed': sum(1 for r in results if not r.get('compress') or not r.get('llm')),
+            'elapsed_seconds': round(elapsed, 2),
+            'llm_cache': self.processor.llm_evaluator.cache.stats(),
+            'prompt_tokens': self.processor.llm_evaluator.prompts.stats()
+        }
+
+    def print_summary(self, summary):
+        print("\nPipeline summary")
+        print(f"  Applicants:    {summary['applicants']}")
+        print(f"  Compressed:    {summary['compressed']}")
+        print(f"  Shortlisted:   {summary['shortlisted']}")
+        print(f"  LLM evaluated: {summary['llm_evaluated']}")
+        print(f"  Failed:        {summary['failed']}")
+        print(f"  LLM cache:     {summary['llm_cache']['hits']} hits, {summary['llm_cache']['misses']} misses")
+        prompts = summary['prompt_tokens']
+        if prompts['prompts']:
+            print(f"  Prompt tokens: {prompts['legacy_tokens']} before -> {prompts['compact_tokens']} after "
+                  f"(estimated, {prompts['saved_pct']}% saved)")
+        print(f"  Wall time:     {summary['elapsed_seconds']}s")
@@ -0,0 +1,184 @@
+import json
+import threading
+from functools import lru_cache
+
+import google.generativeai as genai
+
+from json_codec import decode_profile
+from metrics import get_metrics
+
+# Per-applicant budget for the rendered profile, in estimated tokens
+DEFAULT_PROFILE_TOKENS = 600
+
+SINGLE_INSTRUCTIONS = """You are a recruiting analyst. You are given one applicant profile as compact JSON. Missing keys mean the applicant left that field empty; "older_roles_omitted" counts earlier roles left out for length. Do four things:
+
+1. Provide a concise 75-word summary.
+2. Rate overall candidate quality from 1-10 (higher is better).
+3. List any data gaps or inconsistencies you notice.
+4. Suggest up to three follow-up questions to clarify gaps.
+
+Return exactly in this format:
+Summary: <text>
+Score: <integer>
+Issues: <comma-separated list or 'None'>
+Follow-Ups: <bullet list>"""
+
+BATCH_INSTRUCTIONS = """You are a recruiting analyst. You are given a JSON array of applicant profiles in compact JSON. Missing keys mean the applicant left that field empty; "older_roles_omitted" counts earlier roles left out for length. For EACH profile, do four things:
+
+1. Provide a concise 75-word summary.
+2. Rate overall candidate quality from 1-10 (higher is better).
+3. List any data gaps or inconsistencies you notice.
+4. Suggest up to three follow-up questions to clarify gaps.
+
+Return only a JSON array with exactly one object per applicant:
+[{"applicant_id": "<id from the input>", "summary": "<text>", "score": <integer 1-10>, "issues": "<comma-separated list or 'None'>", "follow_ups": ["<question>", ...]}]"""
+
+INSTRUCTIONS = {'single': SINGLE_INSTRUCTIONS, 'batch': BATCH_INSTRUCTIONS}
+
+
+def estimate_tokens(text):
+    # Rough Gemini token estimate (~4 characters per token), no API call
+    return len(text) // 4 + 1
+
+
+def compact(value):
+    # Drop empty strings, None and empty containers at any depth
+    if isinstance(value, dict):
+        items = ((k, compact(v)) for k, v in value.items())
+        return {k: v for k, v in items if v not in (None, '', [], {})}
+    if isinstance(value, list):
+        return [v for v in map(compact, value) if v not in (None, '', [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def canonical_profile(profile):
+    """Profile with empty fields removed and experience ordered newest first.
+
+    Current roles (no end date) come first, then by end and start date;
+    company and title break ties so the order never depends on Airtable's.
+    """
+    profile = compact(profile)
+    experience = profile.get('experience')
+    if experience:
+        profile['experience'] = sorted(experience, key=lambda e: (
+            e.get('end_date', '9999-99-99'), e.get('start_date', ''), e.get('company', ''), e.get('title', '')
+        ), reverse=True)
+    return profile
+
+
+def render_profile(profile, max_tokens=DEFAULT_PROFILE_TOKENS):
+    """Compact JSON for one profile within ``max_tokens``.
+
+    The oldest roles are dropped first, one at a time, until the profile
+    fits; the newest role is always kept.
+    """
+    profile = canonical_profile(profile)
+    experience = profile.get('experience', [])
+    kept = len(experience)
+    while True:
+        if experience:
+            profile['experience'] = experience[:kept]
+            if kept < len(experience):
+                profile['older_roles_omitted'] = len(experience) - kept
+        text = json.dumps(profile, separators=(',', ':'), ensure_ascii=False)
+        if kept <= 1 or estimate_tokens(text) <= max_tokens:
+            return text
+        kept -= 1
+
+
+# Only needs to span one batch: pack_batches sizes a profile just before batch() renders it
+@lru_cache(maxsize=32)
+def render_compressed(compressed_json, max_tokens=DEFAULT_PROFILE_TOKENS):
+    # Undecodable payloads are passed through as they are
+    try:
+        return render_profile(decode_profile(compressed_json), max_tokens)
+    except ValueError:
+        return compressed_json
+
+
+def legacy_tokens(compressed_json):
+    # What one applicant's prompt cost before: the instructions and the full
+    # decoded profile, indented, empty fields included
+    try:
+        profile = json.dumps(decode_profile(compressed_json), indent=2)
+    except ValueError:
+        profile = compressed_json
+    return estimate_tokens(SINGLE_INSTRUCTIONS + profile)
+
+
+class PromptBuilder:
+    """Builds Gemini prompts from Compressed JSON.
+
+    The instructions are kept apart from the per-applicant body and sent
+    as the model's system instruction. They are still billed on every
+    call, so the token counts include them. ``legacy`` is what the same
+    applicants cost before: one prompt each, with the full indented
+    profile. ``compact`` is what is sent now. Savings come from the
+    compact profiles and, in batched mode, from sharing one set of
+    instructions across the batch. Both are counted in
+    ``llm_prompt_tokens_estimated_total{variant}`` and by ``stats()``.
+    """
+
+    def __init__(self, max_profile_tokens=DEFAULT_PROFILE_TOKENS):
+        self.max_profile_tokens = max_profile_tokens
+        self.legacy_tokens = 0
+        self.compact_tokens = 0
+        self.prompts = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def single(self, compressed_json):
+        body = render_compressed(compressed_json, self.max_profile_tokens)
+        self._count(legacy_tokens(compressed_json), estimate_tokens(SINGLE_INSTRUCTIONS + body))
+        return body
+
+    def batch(self, profiles):
+        # profiles: [(applicant_id, compressed_json), ...]
+        body = '[' + ','.join(
+            '{"applicant_id":%s,"profile":%s}' % (json.dumps(applicant_id),
+                                                  render_compressed(compressed_json, self.max_profile_tokens))
+            for applicant_id, compressed_json in profiles
+        ) + ']'
+        legacy = sum(legacy_tokens(compressed_json) for _, compressed_json in profiles)
+        self._count(legacy, estimate_tokens(BATCH_INSTRUCTIONS + body))
+        return body
+
+    def profile_tokens(self, compressed_json):
+        return estimate_tokens(render_compressed(compressed_json, self.max_profile_tokens))
+
+    def _count(self, legacy, compact):
+        with self._lock:
+            self.legacy_tokens += legacy
+            self.compact_tokens += compact
+            self.prompts += 1
+        metrics = get_metrics()
+        metrics.inc('llm_prompt_tokens_estimated_total', legacy, variant='legacy')
+        metrics.inc('llm_prompt_tokens_estimated_total', compact, variant='compact')
+
+    def stats(self):
+        with self._lock:
+            saved = self.legacy_tokens - self.compact_tokens
+            return {
+                'prompts': self.prompts,
+                'legacy_tokens': self.legacy_tokens,
+                'compact_tokens': self.compact_tokens,
+                'saved_pct': round(100 * saved / self.legacy_tokens, 1) if self.legacy_tokens else 0.0
+            }
+
+    def model_for(self, kind, model_name):
+        # One model per prompt kind, carrying its instructions so prompts only hold the data
+        with self._lock:
+            model = self._models.get((kind, model_name))
+            if model is None:
+                model = genai.GenerativeModel(model_name, system_instruction=INSTRUCTIONS[kind])
+                self._models[(kind, model_name)] = model
+            return model
+
+
+def print_prompt_stats(builder):
+    stats = builder.stats()
+    if stats['prompts']:
+        print(f"Prompt tokens (estimated, instructions included): {stats['legacy_tokens']} before -> "
+              f"{stats['compact_tokens']} after ({stats['saved_pct']}% saved over {stats['prompts']} prompts)")
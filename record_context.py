@@ -0,0 +1,100 @@
+import threading
+
+from json_codec import decode_profile
+from page_stream import chunked
+
+# Applicants fields any stage reads
+CONTEXT_FIELDS = ['Applicant ID', 'Compressed JSON', 'Shortlist Status',
+                  'LLM Summary', 'LLM Score', 'LLM Follow-Ups']
+
+
+class ApplicantContext:
+    """One Applicants record as seen by every stage of a run.
+
+    Stages read ``fields`` and the decoded ``profile`` from here instead of
+    fetching the record again, and record their writes with ``update``. The
+    writes are merged and sent as one update when the context is committed.
+    """
+
+    def __init__(self, record):
+        self.record_id = record['id']
+        self.fields = dict(record['fields'])
+        self.applicant_id = self.fields.get('Applicant ID')
+        self.pending = {}
+        self._profile = None
+
+    @property
+    def compressed_json(self):
+        return self.fields.get('Compressed JSON')
+
+    @property
+    def profile(self):
+        # Decoded once per run; raises ValueError for unreadable JSON
+        if self._profile is None and self.compressed_json:
+            self._profile = decode_profile(self.compressed_json)
+        return self._profile
+
+    def set_profile(self, profile, compressed_json):
+        self.update({'Compressed JSON': compressed_json})
+        self._profile = profile
+
+    def update(self, fields):
+        if 'Compressed JSON' in fields:
+            self._profile = None
+        self.fields.update(fields)
+        self.pending.update(fields)
+
+    def commit(self, writer):
+        if self.pending:
+            writer.update('Applicants', self.record_id, self.pending)
+            self.pending = {}
+
+
+class RunContext:
+    """Identity map of Applicants records for one pipeline run."""
+
+    def __init__(self, api, base_id, writer):
+        self.api = api
+        self.base_id = base_id
+        self.writer = writer
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        context = ApplicantContext(record)
+        with self._lock:
+            return self._contexts.setdefault(context.applicant_id, context)
+
+    def get(self, applicant_id):
+        with self._lock:
+            context = self._contexts.get(applicant_id)
+        if context is not None:
+            return context
+        self.load_many([applicant_id])
+        with self._lock:
+            return self._contexts.get(applicant_id)
+
+    def load_many(self, applicant_ids, chunk_size=50):
+        # One OR query per chunk for records not loaded yet
+        with self._lock:
+            missing = [a for a in applicant_ids if a not in self._contexts]
+        applicants = self.api.table(self.base_id, 'Applicants')
+        for chunk in chunked(missing, chunk_size):
+            formula = "OR(" + ", ".join(f"{{Applicant ID}} = '{a}'" for a in chunk) + ")"
+            for record in applicants.all(formula=formula, fields=CONTEXT_FIELDS):
+                if record['fields'].get('Applicant ID'):
+                    self.add(record)
+        return [self._contexts[a] for a in applicant_ids if a in self._contexts]
+
+    def release(self, applicant_id):
+        # Drop a record from the map without writing anything
+        with self._lock:
+            return self._contexts.pop(applicant_id, None)
+
+    def commit(self, applicant_id):
+        # Queue the record's merged update and drop it from the map
+        with self._lock:
+            context = self._contexts.pop(applicant_id, None)
+        if context is not None:
+            context.commit(self.writer)
+        return context
@@ -0,0 +1,292 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlparse
+
+from pyairtable import Api
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+# Airtable allows 5 requests per second per base
+DEFAULT_RATE = 5.0
+
+# Airtable asks clients to back off for 30 seconds after a 429
+DEFAULT_RETRY_AFTER = 30.0
+
+# Priority classes: lower values are served first
+PRIORITY_READ = 0    # reads the next pipeline stage is waiting on
+PRIORITY_WRITE = 1   # background writes (batch flushes)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        # Seconds until a token is available (0 if one is available now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RequestScheduler:
+    """Shares Airtable's per-base request budget between every component.
+
+    Each base gets a token bucket refilled at ``rate`` requests per second.
+    Callers wait in a priority queue, so stage-critical reads are served
+    before background writes, and a 429 pauses the whole base for the
+    server's Retry-After interval instead of letting every caller retry.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._queues = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+        # Optional SharedBudget when several processes share the rate
+        self.budget = None
+
+        self.requests = 0
+        self.throttled = 0
+
+    def acquire(self, base_id, priority=PRIORITY_READ):
+        with self._cond:
+            bucket = self._buckets.setdefault(base_id, TokenBucket(self.rate, self.burst))
+            queue = self._queues.setdefault(base_id, [])
+            ticket = (priority, next(self._seq))
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    if queue[0] == ticket:
+                        delay = bucket.delay(time.monotonic())
+                        if delay <= 0:
+                            bucket.take()
+                            self.requests += 1
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+        if self.budget is not None:
+            self.budget.acquire(base_id)
+
+    def pause(self, base_id, seconds):
+        with self._cond:
+            bucket = self._buckets.setdefault(base_id, TokenBucket(self.rate, self.burst))
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + seconds)
+            bucket.tokens = 0
+            self.throttled += 1
+            self._cond.notify_all()
+        if self.budget is not None:
+            self.budget.pause(base_id, seconds)
+
+    @contextmanager
+    def priority(self, priority):
+        # Override the priority class of requests made by this thread
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def priority_for(self, method, url):
+        override = getattr(self._local, 'priority', None)
+        if override is not None:
+            return override
+        # pyairtable turns long list queries into POST .../listRecords
+        if method == 'GET' or url.endswith('/listRecords'):
+            return PRIORITY_READ
+        return PRIORITY_WRITE
+
+
+class SharedBudget:
+    """Token buckets kept in a SQLite file so several processes share one rate.
+
+    Every worker pointing at the same file draws from the same buckets, one
+    per name (an Airtable base ID, or ``gemini``). A pause set by one
+    worker after a 429 holds back all of them. Like LeaseQueue, the file
+    is in WAL mode and only works for processes on one host.
+    """
+
+    def __init__(self, path, rates=None, default_rate=DEFAULT_RATE):
+        self.path = path
+        self.rates = rates or {}
+        self.default_rate = default_rate
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                paused_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    def acquire(self, name):
+        rate = self.rates.get(name, self.default_rate)
+        while True:
+            delay = self._try_take(name, rate)
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _try_take(self, name, rate):
+        # Takes a token and returns 0, or returns the seconds to wait.
+        # Wall-clock time, since monotonic clocks differ between processes.
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated, paused_until FROM rate_buckets WHERE name = ?", (name,)
+                ).fetchone()
+                tokens, updated, paused_until = row if row else (1.0, now, 0.0)
+                if now < paused_until:
+                    delay = paused_until - now
+                else:
+                    tokens = min(1.0, tokens + max(0.0, now - updated) * rate)
+                    delay = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                    if delay <= 0:
+                        tokens -= 1
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated, paused_until) "
+                        "VALUES (?, ?, ?, ?)",
+                        (name, tokens, now, paused_until)
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return delay
+
+    def pause(self, name, seconds):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO rate_buckets (name, tokens, updated, paused_until) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = 0, "
+                "paused_until = MAX(paused_until, excluded.paused_until)",
+                (name, now, now + seconds)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ScheduledAdapter(HTTPAdapter):
+    """requests adapter that sends every Airtable call through the scheduler."""
+
+    def __init__(self, scheduler, max_throttle_retries=5, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.max_throttle_retries = max_throttle_retries
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        # Paths look like /v0/{baseId}/{table}; meta endpoints share one bucket
+        parts = url.path.strip('/').split('/')
+        base_id = parts[1] if len(parts) > 1 and parts[1].startswith('app') else 'meta'
+        table = unquote(parts[2]) if base_id != 'meta' and len(parts) > 2 else 'meta'
+        priority = self.scheduler.priority_for(request.method, url.path)
+        metrics = get_metrics()
+
+        started = time.perf_counter()
+        for attempt in range(self.max_throttle_retries + 1):
+            self.scheduler.acquire(base_id, priority)
+            response = super().send(request, **kwargs)
+            metrics.inc('airtable_requests_total', table=table, method=request.method,
+                        status=response.status_code)
+            if response.status_code not in (429, 503) or attempt == self.max_throttle_retries:
+                metrics.observe('airtable_request_seconds', time.perf_counter() - started, method=request.method)
+                return response
+            metrics.inc('airtable_throttled_total', table=table)
+            wait = retry_after_seconds(response.headers.get('Retry-After'))
+            print(f"Airtable throttled request ({response.status_code}), pausing {base_id} for {wait:.0f}s")
+            self.scheduler.pause(base_id, wait)
+            response.close()
+        return response
+
+
+def retry_after_seconds(header, default=DEFAULT_RETRY_AFTER):
+    if not header:
+        return default
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class SharedApi(Api):
+    """Api that hands out one Table object per table instead of a new one per call."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+
+    def table(self, base_id, table_name, **kwargs):
+        if kwargs:
+            return super().table(base_id, table_name, **kwargs)
+        with self._tables_lock:
+            key = (base_id, table_name)
+            if key not in self._tables:
+                self._tables[key] = super().table(base_id, table_name)
+            return self._tables[key]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(rate=float(os.getenv('AIRTABLE_RATE', DEFAULT_RATE)))
+        return _scheduler
+
+
+def create_api(scheduler=None):
+    # Every component builds its Api here so all Airtable traffic in the
+    # process shares one rate budget
+    # AIRTABLE_ENDPOINT_URL points every component at a stand-in server (see fakes.FakeAirtable)
+    endpoint_url = os.getenv('AIRTABLE_ENDPOINT_URL')
+    kwargs = {'endpoint_url': endpoint_url} if endpoint_url else {}
+    api = SharedApi(os.getenv('AIRTABLE_API_KEY'), retry_strategy=False, **kwargs)
+    adapter = ScheduledAdapter(scheduler or get_scheduler())
+    api.session.mount('https://', adapter)
+    api.session.mount('http://', adapter)
+    return api
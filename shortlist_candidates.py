@@ -1,14 +1,28 @@
+import hashlib
 import os
-from pyairtable import Api
+import sys
+from request_scheduler import create_api
 from dotenv import load_dotenv
-import json
 from datetime import datetime, date
+from batch_writer import BatchWriter
+from json_codec import decode_profile
+from record_context import ApplicantContext
+from shortlist_engine import ShortlistEngine, score_reason
+from metrics import timed
+from page_stream import chunked
+
+# A lead is rewritten only when one of these differs
+LEAD_COMPARE_FIELDS = ['Compressed JSON', 'Score Reason']
 
 class CandidateShortlister:
-    def __init__(self):
-        self.api = Api(os.getenv('AIRTABLE_API_KEY'))
+    def __init__(self, writer=None, api=None):
+        self.api = api or create_api()
         self.base_id = os.getenv('AIRTABLE_BASE_ID')
         
+        # Writes are buffered; a shared writer is flushed by its owner
+        self.writer = writer or BatchWriter(self.api, self.base_id)
+        self.owns_writer = writer is None
+        
         # Define tier-1 companies
         self.tier1_companies = {
             'Google', 'Meta', 'OpenAI', 'Microsoft', 'Apple', 
@@ -21,20 +35,27 @@ class CandidateShortlister:
             'United Kingdom', 'Germany', 'India'
         }
         
-    def evaluate_candidate(self, applicant_id):
-        # Get compressed JSON
-        applicants = self.api.table(self.base_id, 'Applicants')
-        records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'")
+        # Applicant ID -> digest of its lead (None: no lead) for loaded applicants
+        self.leads = None
         
-        if not records:
-            return False, "Applicant not found"
+    @timed('shortlist')
+    def evaluate_candidate(self, applicant_id, context=None):
+        # A run context already holds the record and its decoded profile
+        standalone = context is None
+        if standalone:
+            applicants = self.api.table(self.base_id, 'Applicants')
+            records = applicants.all(formula=f"{{Applicant ID}} = '{applicant_id}'", fields=['Compressed JSON'])
             
-        compressed_json = records[0]['fields'].get('Compressed JSON')
+            if not records:
+                return False, "Applicant not found"
+            context = ApplicantContext(records[0])
+            
+        compressed_json = context.compressed_json
         if not compressed_json:
             return False, "No data found"
             
         try:
-            data = json.loads(compressed_json)
+            data = context.profile
         except:
             return False, "Invalid JSON data"
             
@@ -47,34 +68,75 @@ class CandidateShortlister:
         is_shortlisted = experience_pass and compensation_pass and location_pass
         
         # Create reason summary
-        reasons = []
-        if experience_pass:
-            reasons.append(f"✓ Experience: {exp_reason}")
-        else:
-            reasons.append(f"✗ Experience: {exp_reason}")
-            
-        if compensation_pass:
-            reasons.append(f"✓ Compensation: {comp_reason}")
-        else:
-            reasons.append(f"✗ Compensation: {comp_reason}")
-            
-        if location_pass:
-            reasons.append(f"✓ Location: {loc_reason}")
-        else:
-            reasons.append(f"✗ Location: {loc_reason}")
-            
-        score_reason = "\n".join(reasons)
+        reason = score_reason(
+            (experience_pass, exp_reason),
+            (compensation_pass, comp_reason),
+            (location_pass, loc_reason)
+        )
         
         # Update shortlist status
-        applicants.update(records[0]['id'], {
+        context.update({
             'Shortlist Status': 'Shortlisted' if is_shortlisted else 'Not Shortlisted'
         })
         
         # If shortlisted, create lead record
         if is_shortlisted:
-            self.create_shortlisted_lead(applicant_id, compressed_json, score_reason)
+            self.create_shortlisted_lead(applicant_id, compressed_json, reason)
             
-        return is_shortlisted, score_reason
+        if standalone:
+            context.commit(self.writer)
+        if self.owns_writer:
+            self.writer.flush()
+            
+        return is_shortlisted, reason
+        
+    def engine(self):
+        # Built from the current criteria so customized sets are honoured
+        return ShortlistEngine(self.tier1_companies, self.approved_locations)
+        
+    def evaluate_profiles(self, profiles):
+        # Local-only bulk evaluation: {applicant_id: decoded JSON} -> {applicant_id: (bool, reason)}
+        return self.engine().evaluate(profiles)
+        
+    def evaluate_population(self):
+        # Re-run the rules over every applicant from a single table scan
+        applicants = self.api.table(self.base_id, 'Applicants')
+        records = applicants.all(fields=['Applicant ID', 'Compressed JSON', 'Shortlist Status'])
+        # The scan finds every lead, so applicants missing from it have none
+        leads = self.load_leads()
+        
+        profiles = {}
+        by_applicant = {}
+        for record in records:
+            applicant_id = record['fields'].get('Applicant ID')
+            compressed_json = record['fields'].get('Compressed JSON')
+            if not applicant_id or not compressed_json:
+                continue
+            try:
+                profiles[applicant_id] = decode_profile(compressed_json)
+            except ValueError:
+                continue
+            by_applicant[applicant_id] = record
+            
+        for applicant_id in profiles:
+            leads.setdefault(applicant_id, None)
+            
+        results = self.evaluate_profiles(profiles)
+        
+        # Only write statuses that changed; every shortlisted lead is
+        # upserted, since its Score Reason may have changed
+        for applicant_id, (is_shortlisted, reason) in results.items():
+            record = by_applicant[applicant_id]
+            status = 'Shortlisted' if is_shortlisted else 'Not Shortlisted'
+            if record['fields'].get('Shortlist Status') != status:
+                self.writer.update('Applicants', record['id'], {'Shortlist Status': status})
+            if is_shortlisted:
+                self.create_shortlisted_lead(applicant_id, record['fields']['Compressed JSON'], reason)
+                
+        if self.owns_writer:
+            self.writer.flush()
+            
+        return results
         
     def check_experience(self, experience_list):
         if not experience_list:
@@ -134,17 +196,98 @@ class CandidateShortlister:
         return False, f"Location not approved: {location}"
         
     def create_shortlisted_lead(self, applicant_id, compressed_json, score_reason):
-        leads_table = self.api.table(self.base_id, 'Shortlisted Leads')
-        
-        leads_table.create({
+        # Upserted on Applicant so re-runs never add a second lead; unchanged
+        # leads are not written at all
+        fields = {
             'Applicant': applicant_id,
             'Compressed JSON': compressed_json,
             'Score Reason': score_reason
-        })
+        }
+        digest = lead_digest(fields)
+        if self.find_lead(applicant_id) == digest:
+            return False
+            
+        self.writer.upsert('Shortlisted Leads', fields, key_fields=['Applicant'])
+        if self.leads is not None:
+            self.leads[applicant_id] = digest
+        return True
+        
+    def load_leads(self, applicant_ids=None, chunk_size=50):
+        # Digests of existing leads, for the given applicants (one OR query
+        # per chunk, e.g. once per page) or for everyone (one table scan).
+        # Only digests are kept, never the leads' JSON.
+        leads_table = self.api.table(self.base_id, 'Shortlisted Leads')
+        if self.leads is None:
+            self.leads = {}
+        if applicant_ids is None:
+            queries = [None]
+        else:
+            applicant_ids = [a for a in applicant_ids if a not in self.leads]
+            self.leads.update(dict.fromkeys(applicant_ids))
+            queries = ["OR(" + ", ".join(f"{{Applicant}} = '{a}'" for a in chunk) + ")"
+                       for chunk in chunked(applicant_ids, chunk_size)]
+        for formula in queries:
+            for record in leads_table.all(formula=formula, fields=['Applicant'] + LEAD_COMPARE_FIELDS):
+                applicant_id = record['fields'].get('Applicant')
+                if applicant_id:
+                    self.leads[applicant_id] = lead_digest(record['fields'])
+        return self.leads
+        
+    def forget_leads(self, applicant_ids):
+        # Drop digests once their applicants are done, so a run's memory stays bounded
+        if self.leads is not None:
+            for applicant_id in applicant_ids:
+                self.leads.pop(applicant_id, None)
+                
+    def find_lead(self, applicant_id):
+        # Digest of the applicant's lead, or None if it has none
+        if self.leads is not None and applicant_id in self.leads:
+            return self.leads[applicant_id]
+        leads_table = self.api.table(self.base_id, 'Shortlisted Leads')
+        record = leads_table.first(formula=f"{{Applicant}} = '{applicant_id}'",
+                                   fields=LEAD_COMPARE_FIELDS)
+        return lead_digest(record['fields']) if record else None
+        
+    def dedupe_leads(self):
+        # Keep the newest lead per applicant and delete the rest.
+        # Upserts fail while an applicant still has several leads.
+        leads_table = self.api.table(self.base_id, 'Shortlisted Leads')
+        records = leads_table.all(fields=['Applicant'] + LEAD_COMPARE_FIELDS)
+        
+        newest = {}
+        duplicates = []
+        for record in sorted(records, key=lambda r: r.get('createdTime', '')):
+            applicant_id = record['fields'].get('Applicant')
+            if not applicant_id:
+                continue
+            if applicant_id in newest:
+                duplicates.append(newest[applicant_id])
+            newest[applicant_id] = record
+            
+        for record in duplicates:
+            self.writer.delete('Shortlisted Leads', record['id'])
+        self.writer.flush()
+        
+        self.leads = {a: lead_digest(record['fields']) for a, record in newest.items()}
+        return len(duplicates)
+
+def lead_digest(fields):
+    # Short fingerprint of the fields that decide whether a lead is rewritten
+    digest = hashlib.blake2b(digest_size=16)
+    for name in LEAD_COMPARE_FIELDS:
+        digest.update(str(fields.get(name, '')).encode('utf-8') + b'\0')
+    return digest.digest()
 
 # Usage
 if __name__ == "__main__":
     shortlister = CandidateShortlister()
+    
+    # One-off cleanup of duplicate leads: python shortlist_candidates.py --dedupe-leads
+    if '--dedupe-leads' in sys.argv:
+        removed = shortlister.dedupe_leads()
+        print(f"Removed {removed} duplicate leads")
+        sys.exit(0)
+        
     is_shortlisted, reason = shortlister.evaluate_candidate("002")
     print(f"Shortlisted: {is_shortlisted}")
     print(f"Reason: {reason}")
\ No newline at end of file
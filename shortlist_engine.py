@@ -0,0 +1,159 @@
+import re
+from datetime import datetime
+
+import numpy as np
+
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# Experience without parseable dates counts as 2 years, as in check_experience
+FALLBACK_YEARS = 2.0
+
+
+class ShortlistEngine:
+    """Applies the shortlist rules to a whole population of decoded profiles.
+
+    Experience rows from every applicant are flattened into arrays, dates
+    are parsed and tenure summed with NumPy in one pass, and companies and
+    locations are matched with single precompiled patterns. Verdicts and
+    reason strings are identical to ``CandidateShortlister.evaluate_candidate``.
+    """
+
+    def __init__(self, tier1_companies, approved_locations, min_years=4,
+                 max_rate=100, min_availability=20):
+        self.min_years = min_years
+        self.max_rate = max_rate
+        self.min_availability = min_availability
+
+        self.tier1_pattern = re.compile(
+            '|'.join(re.escape(c) for c in sorted(tier1_companies, key=len, reverse=True)) or r'(?!)'
+        )
+        self.location_pattern = re.compile(
+            '|'.join(re.escape(l.lower()) for l in sorted(approved_locations, key=len, reverse=True)) or r'(?!)'
+        )
+
+    def evaluate(self, profiles):
+        # profiles: {applicant_id: decoded JSON} -> {applicant_id: (is_shortlisted, score_reason)}
+        applicant_ids = list(profiles)
+        count = len(applicant_ids)
+        if not count:
+            return {}
+
+        experience = [profiles[a].get('experience', []) or [] for a in applicant_ids]
+        salary = [profiles[a].get('salary', {}) or {} for a in applicant_ids]
+        personal = [profiles[a].get('personal', {}) or {} for a in applicant_ids]
+
+        exp_pass, exp_reasons = self._check_experience(experience, count)
+        comp_pass, comp_reasons = self._check_compensation(salary)
+        loc_pass, loc_reasons = self._check_location(personal)
+        shortlisted = exp_pass & comp_pass & loc_pass
+
+        results = {}
+        for i, applicant_id in enumerate(applicant_ids):
+            results[applicant_id] = (bool(shortlisted[i]), score_reason(
+                (exp_pass[i], exp_reasons[i]),
+                (comp_pass[i], comp_reasons[i]),
+                (loc_pass[i], loc_reasons[i])
+            ))
+        return results
+
+    def _check_experience(self, experience, count):
+        owners = np.fromiter((i for i, rows in enumerate(experience) for _ in rows), dtype=np.int64)
+        rows = [row for rows in experience for row in rows]
+        companies = [(row.get('company', '') or '').strip() for row in rows]
+
+        # First tier-1 company per applicant, in row order
+        tier1_rows = np.fromiter((self.tier1_pattern.fullmatch(c) is not None for c in companies),
+                                 dtype=bool, count=len(companies))
+        tier1_company = {}
+        hit_rows = np.flatnonzero(tier1_rows)
+        owners_hit, first = np.unique(owners[hit_rows], return_index=True)
+        for owner, row in zip(owners_hit, hit_rows[first]):
+            tier1_company[int(owner)] = companies[row]
+
+        # Total tenure: only rows with both dates count, like check_experience
+        starts = [row.get('start_date') for row in rows]
+        ends = [row.get('end_date') for row in rows]
+        dated = np.fromiter((bool(s) and bool(e) for s, e in zip(starts, ends)), dtype=bool, count=len(rows))
+        start_days = parse_dates(starts)
+        end_days = parse_dates(ends)
+        parsed = ~np.isnat(start_days) & ~np.isnat(end_days)
+        years = np.where(parsed, (end_days - start_days).astype('float64') / 365.25, FALLBACK_YEARS)
+        years = np.where(dated, years, 0.0)
+        total_years = np.bincount(owners, weights=years, minlength=count) if len(rows) else np.zeros(count)
+
+        passed = np.zeros(count, dtype=bool)
+        reasons = []
+        for i in range(count):
+            if not experience[i]:
+                reasons.append("No work experience provided")
+            elif i in tier1_company:
+                passed[i] = True
+                reasons.append(f"Worked at tier-1 company: {tier1_company[i]}")
+            elif total_years[i] >= self.min_years:
+                passed[i] = True
+                reasons.append(f"Has {total_years[i]:.1f} years of experience")
+            else:
+                reasons.append(f"Only {total_years[i]:.1f} years of experience (need {self.min_years}+)")
+        return passed, reasons
+
+    def _check_compensation(self, salary):
+        rates = [s.get('preferred_rate', 0) for s in salary]
+        hours = [s.get('availability', 0) for s in salary]
+        rate_ok = np.array([r or 0 for r in rates], dtype='float64') <= self.max_rate
+        hours_ok = np.array([h or 0 for h in hours], dtype='float64') >= self.min_availability
+        passed = rate_ok & hours_ok
+
+        reasons = []
+        for i in range(len(salary)):
+            if passed[i]:
+                reasons.append(f"Rate: ${rates[i]}/hr, Availability: {hours[i]}hrs/week")
+                continue
+            issues = []
+            if not rate_ok[i]:
+                issues.append(f"Rate too high: ${rates[i]}/hr (max ${self.max_rate})")
+            if not hours_ok[i]:
+                issues.append(f"Low availability: {hours[i]}hrs/week (min {self.min_availability})")
+            reasons.append("; ".join(issues))
+        return passed, reasons
+
+    def _check_location(self, personal):
+        locations = [(p.get('location', '') or '').strip() for p in personal]
+        passed = np.fromiter((self.location_pattern.search(l.lower()) is not None for l in locations),
+                             dtype=bool, count=len(locations))
+        reasons = [
+            f"Located in approved region: {l}" if ok else f"Location not approved: {l}"
+            for l, ok in zip(locations, passed)
+        ]
+        return passed, reasons
+
+
+def parse_dates(values):
+    # ISO dates are converted in bulk; anything else goes through strptime like
+    # check_experience does, and unparseable values become NaT
+    days = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+    iso = [i for i, v in enumerate(values) if isinstance(v, str) and _ISO_DATE.fullmatch(v)]
+    try:
+        days[iso] = np.array([values[i] for i in iso], dtype='datetime64[D]')
+    except ValueError:
+        # An out-of-range day somewhere; fall back to per-value parsing
+        iso = []
+    done = set(iso)
+    for i, value in enumerate(values):
+        if i in done or not value:
+            continue
+        try:
+            days[i] = np.datetime64(datetime.strptime(value, '%Y-%m-%d').date(), 'D')
+        except (TypeError, ValueError):
+            pass
+    return days
+
+
+def score_reason(experience, compensation, location):
+    # Each argument is a (passed, reason) pair
+    reasons = []
+    for label, (passed, reason) in (('Experience', experience),
+                                    ('Compensation', compensation),
+                                    ('Location', location)):
+        mark = "✓" if passed else "✗"
+        reasons.append(f"{mark} {label}: {reason}")
+    return "\n".join(reasons)
@@ -0,0 +1,237 @@
+"""Offline snapshots of the Applicants table.
+
+    python snapshot.py export [--path applicants.ndjson]
+    python snapshot.py shortlist [--path applicants.ndjson]
+    python snapshot.py llm [--path applicants.ndjson] [--fake | --cached-only] [--force]
+
+``export`` is the only command that talks to Airtable. The replay commands
+read the snapshot and make no API calls, so shortlist rule changes and
+re-scoring experiments run over the whole history locally.
+"""
+import argparse
+import json
+import mmap
+import os
+import time
+
+from dotenv import load_dotenv
+
+from json_codec import decode_profile
+from record_context import ApplicantContext, CONTEXT_FIELDS
+
+DEFAULT_SNAPSHOT_PATH = 'applicants.ndjson'
+
+# Bump when the row or index layout changes
+SNAPSHOT_VERSION = 1
+
+
+def export_snapshot(api, base_id, path=DEFAULT_SNAPSHOT_PATH, page_size=100):
+    """Write every Applicants record to ``path`` as NDJSON, plus an offset index.
+
+    Each line holds the record's stage fields and its decoded profile; the
+    ``.idx`` file lists Applicant IDs with the byte offset of their line.
+    Both files are written next to the target and moved into place at the
+    end, so an open snapshot is never half-replaced. Returns the row count.
+    """
+    applicants = api.table(base_id, 'Applicants')
+    ids, offsets = [], []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for page in applicants.iterate(page_size=page_size, fields=CONTEXT_FIELDS):
+            for record in page:
+                applicant_id = record['fields'].get('Applicant ID')
+                if not applicant_id:
+                    continue
+                try:
+                    profile = decode_profile(record['fields'].get('Compressed JSON') or '')
+                except ValueError:
+                    profile = None
+                row = {'applicant_id': applicant_id, 'record_id': record['id'],
+                       'fields': record['fields'], 'profile': profile}
+                ids.append(applicant_id)
+                offsets.append(f.tell())
+                f.write(json.dumps(row, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n')
+        offsets.append(f.tell())
+
+    index = {'version': SNAPSHOT_VERSION, 'base_id': base_id, 'exported': time.time(),
+             'ids': ids, 'offsets': offsets}
+    with open(index_path(tmp_path), 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    os.replace(index_path(tmp_path), index_path(path))
+    return len(ids)
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of an exported snapshot.
+
+    Rows are parsed only when read, so looking up a few applicants in a
+    large snapshot costs a few slices of the mapped file.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        if index.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {index.get('version')}")
+        self.base_id = index['base_id']
+        self.exported = index['exported']
+        self.ids = index['ids']
+        self.offsets = index['offsets']
+        self.positions = {applicant_id: i for i, applicant_id in enumerate(self.ids)}
+
+        self._file = open(path, 'rb')
+        # mmap cannot map an empty file
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b''
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self.row(i)
+
+    def __contains__(self, applicant_id):
+        return applicant_id in self.positions
+
+    def row(self, i):
+        return json.loads(self._data[self.offsets[i]:self.offsets[i + 1]])
+
+    def get(self, applicant_id):
+        i = self.positions.get(applicant_id)
+        return None if i is None else self.row(i)
+
+    def profiles(self):
+        # {applicant_id: decoded profile}, skipping rows without a readable profile
+        return {row['applicant_id']: row['profile'] for row in self if row['profile'] is not None}
+
+    def contexts(self):
+        # ApplicantContexts the pipeline stages can read and update; nothing is committed
+        return {row['applicant_id']: ApplicantContext({'id': row['record_id'], 'fields': row['fields']})
+                for row in self}
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OfflineModel:
+    """Stand-in Gemini model for replays that may only use cached results.
+
+    It keys cache lookups with the Gemini model's name so it can read real
+    results; it never produces one, and is paired with a read-only cache.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        raise LookupError("Offline replay: no cached result for this profile")
+
+
+def replay_shortlist(snapshot, shortlister):
+    """Re-run the shortlist rules over a snapshot without calling Airtable.
+
+    Returns ``{applicant_id: (is_shortlisted, reason)}`` and the applicants
+    whose status would change, as ``{applicant_id: (old status, new status)}``.
+    """
+    profiles, statuses = {}, {}
+    for row in snapshot:
+        if row['profile'] is not None:
+            profiles[row['applicant_id']] = row['profile']
+            statuses[row['applicant_id']] = row['fields'].get('Shortlist Status')
+
+    results = shortlister.evaluate_profiles(profiles)
+    changes = {}
+    for applicant_id, (is_shortlisted, _) in results.items():
+        status = 'Shortlisted' if is_shortlisted else 'Not Shortlisted'
+        if statuses[applicant_id] != status:
+            changes[applicant_id] = (statuses[applicant_id], status)
+    return results, changes
+
+
+def replay_llm(snapshot, evaluator, force=False):
+    """Score a snapshot with ``evaluator`` without calling Airtable.
+
+    The evaluator should carry a fake or offline model unless Gemini calls
+    are intended. Returns ``{applicant_id: success}`` and, for applicants
+    whose score changed, ``{applicant_id: (old score, new score)}``.
+    """
+    contexts = snapshot.contexts()
+    before = {applicant_id: context.fields.get('LLM Score') for applicant_id, context in contexts.items()}
+    results = evaluator.evaluate_applicants(list(contexts), contexts=contexts, force=force)
+    changes = {}
+    for applicant_id, success in results.items():
+        score = contexts[applicant_id].fields.get('LLM Score')
+        if success and score != before[applicant_id]:
+            changes[applicant_id] = (before[applicant_id], score)
+    return results, changes
+
+
+def print_changes(label, changes, limit=20):
+    print(f"{label}: {len(changes)} changed")
+    for applicant_id, (old, new) in list(changes.items())[:limit]:
+        print(f"  {applicant_id}: {old} -> {new}")
+    if len(changes) > limit:
+        print(f"  ... and {len(changes) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['export', 'shortlist', 'llm'])
+    parser.add_argument('--path', default=DEFAULT_SNAPSHOT_PATH, help='snapshot file')
+    parser.add_argument('--fake', action='store_true', help='llm: score with FakeGeminiModel')
+    parser.add_argument('--cached-only', action='store_true', help='llm: only use results in the LLM cache')
+    parser.add_argument('--cache', help='llm: LLM cache file (default: LLM_CACHE_PATH or .llm_cache.sqlite '
+                                        'for --cached-only, in memory for --fake)')
+    parser.add_argument('--force', action='store_true', help='llm: ignore cached and stored results')
+    args = parser.parse_args()
+    load_dotenv()
+
+    if args.command == 'export':
+        from request_scheduler import create_api
+        started = time.perf_counter()
+        count = export_snapshot(create_api(), os.getenv('AIRTABLE_BASE_ID'), args.path)
+        print(f"Exported {count} applicants to {args.path} in {time.perf_counter() - started:.1f}s")
+        return
+
+    with Snapshot(args.path) as snapshot:
+        started = time.perf_counter()
+        if args.command == 'shortlist':
+            from shortlist_candidates import CandidateShortlister
+            results, changes = replay_shortlist(snapshot, CandidateShortlister())
+            shortlisted = sum(1 for is_shortlisted, _ in results.values() if is_shortlisted)
+            print(f"Shortlisted {shortlisted} of {len(results)} applicants")
+            print_changes("Shortlist Status", changes)
+        else:
+            if not (args.fake or args.cached_only):
+                parser.error("llm replay needs --fake or --cached-only")
+            from fakes import FakeGeminiModel
+            from llm_cache import LLMCache
+            from llm_evaluation import LLMEvaluator, MODEL_NAME
+            if args.fake:
+                # Fake results are keyed under the fake's own model name and kept out of the real cache
+                model, cache = FakeGeminiModel(latency=0.0, jitter=0.0), LLMCache(args.cache or ':memory:')
+            else:
+                model, cache = OfflineModel(MODEL_NAME), LLMCache(args.cache, read_only=True)
+            evaluator = LLMEvaluator(model=model, cache=cache)
+            results, changes = replay_llm(snapshot, evaluator, force=args.force)
+            print(f"Scored {sum(results.values())} of {len(results)} applicants")
+            print_changes("LLM Score", changes)
+        print(f"Replayed {len(snapshot)} applicants in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_STATE_PATH = '.sync_state.json'
+
+# Start the next window a little early so clock skew between us and
+# Airtable can't drop a change; reprocessing is idempotent
+CLOCK_SKEW = timedelta(minutes=2)
+
+
+class SyncState:
+    """Local last-modified watermark for incremental runs.
+
+    Applicants a run could not finish are saved with the watermark and
+    retried by the next run, since the watermark has moved past the edits
+    that made them pending. Deleted child rows leave no modified time
+    behind; they are found through the ChildRowIndex instead (see
+    AirtableCompressor.get_deleted_applicant_ids).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SYNC_STATE_PATH', DEFAULT_STATE_PATH)
+
+    def load(self):
+        return self._read().get('watermark')
+
+    def load_retry(self):
+        # Applicant IDs left unfinished by the last run
+        return self._read().get('retry', [])
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self, watermark, retry=()):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'watermark': watermark, 'retry': sorted(retry)}, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def next_watermark(self):
+        # Taken before a run starts: anything changed during the run is picked up next time
+        start = datetime.now(timezone.utc) - CLOCK_SKEW
+        return start.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def modified_since_formula(watermark):
+    return f"IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{watermark}'))"
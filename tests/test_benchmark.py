@@ -0,0 +1,36 @@
+import json
+from urllib.parse import urlencode
+
+import benchmark
+from fakes import FakeAirtable
+
+
+def test_listing_pages_through_a_snapshot_while_records_change():
+    airtable = FakeAirtable(rate=0)
+    airtable.insert('appTEST', 'Applicants', [{'Applicant ID': f"{n:03d}"} for n in range(250)])
+    query = {'filterByFormula': "{Compressed JSON} = ''", 'pageSize': 100}
+    seen = []
+    while True:
+        status, page, _ = airtable.handle('GET', '/v0/appTEST/Applicants?' + urlencode(query), {}, 'Bearer test')
+        assert status == 200
+        ids = [r['fields']['Applicant ID'] for r in page['records']]
+        seen.extend(ids)
+        # Processing a page takes its records out of the filter
+        updates = [{'id': r['id'], 'fields': {'Compressed JSON': json.dumps({})}} for r in page['records']]
+        for start in range(0, len(updates), 10):
+            airtable.handle('PATCH', '/v0/appTEST/Applicants', {'records': updates[start:start + 10]}, 'Bearer test')
+        if 'offset' not in page:
+            break
+        query['offset'] = page['offset']
+    assert len(seen) == len(set(seen)) == 250
+
+
+def test_benchmark_evaluates_every_applicant(monkeypatch):
+    # run_benchmark points the environment at its fake; put it back afterwards
+    for key in ('AIRTABLE_ENDPOINT_URL', 'AIRTABLE_API_KEY', 'AIRTABLE_BASE_ID', 'AIRTABLE_RATE',
+                'LLM_CACHE_PATH', 'CHECKPOINT_PATH', 'CHILD_INDEX_PATH'):
+        monkeypatch.delenv(key, raising=False)
+    report = benchmark.run_benchmark(500, airtable_rate=1000, llm_latency=0.0, llm_jitter=0.0, decompress_sample=5)
+    assert report['evaluated'] == 500
+    # One merged update per applicant, 10 records per request
+    assert report['requests_by_table']['Applicants update'] == 50
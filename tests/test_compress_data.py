@@ -0,0 +1,44 @@
+import pytest
+from pyairtable import Api
+
+from child_index import ChildRowIndex
+from compress_data import AirtableCompressor
+from fakes import FakeAirtable
+
+BASE_ID = 'appTEST'
+
+
+@pytest.fixture
+def airtable():
+    air = FakeAirtable(rate=1000)
+    air.insert(BASE_ID, 'Personal Details', [{'Applicant ID': '000001'}, {'Applicant ID': '000002'}])
+    air.insert(BASE_ID, 'Work Experience', [{'Applicant ID': '000001', 'Company': 'Acme Corp'},
+                                            {'Applicant ID': '000001', 'Company': 'Globex'},
+                                            {'Applicant ID': '000002', 'Company': 'Initech'}])
+    air.insert(BASE_ID, 'Salary Preferences', [])
+    air.start()
+    yield air
+    air.stop()
+
+
+@pytest.fixture
+def compressor(airtable, tmp_path, monkeypatch):
+    monkeypatch.setenv('AIRTABLE_BASE_ID', BASE_ID)
+    return AirtableCompressor(writer=object(), api=Api('test-key', endpoint_url=airtable.url),
+                              child_rows=ChildRowIndex(str(tmp_path / 'child_rows.sqlite')))
+
+
+def test_reading_child_rows_fills_the_index(compressor):
+    compressor.get_all_applicant_data(['000001', '000002'])
+    assert sorted(compressor.child_rows.rows('Work Experience').values()) == ['000001', '000001', '000002']
+
+
+def test_deleted_child_rows_are_traced_to_their_applicant(compressor, airtable):
+    compressor.get_all_applicant_data(['000001', '000002'])
+    jobs = airtable.tables[(BASE_ID, 'Work Experience')]
+    globex = next(r for r, record in jobs.items() if record['fields']['Company'] == 'Globex')
+    del jobs[globex]
+
+    assert compressor.get_deleted_applicant_ids() == {'000001'}
+    # Reported once; the recompressed applicant's rows are indexed afresh
+    assert compressor.get_deleted_applicant_ids() == set()
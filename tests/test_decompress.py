@@ -0,0 +1,46 @@
+from decompress import AirtableDecompressor
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, table_name, fields):
+        self.calls.append(('create', fields['Company']))
+
+    def update(self, table_name, record_id, fields):
+        self.calls.append(('update', record_id, fields))
+
+    def delete(self, table_name, record_id):
+        self.calls.append(('delete', record_id))
+
+
+def job(company, start, title='Engineer'):
+    return {'company': company, 'title': title, 'start_date': start, 'end_date': '', 'technologies': ''}
+
+
+def row(record_id, company, start, title='Engineer'):
+    return {'id': record_id, 'fields': {'Applicant ID': '000001', 'Company': company, 'Title': title,
+                                        'Start Date': start}}
+
+
+def decompress(existing, experience):
+    writer = RecordingWriter()
+    AirtableDecompressor(writer=writer, api=object()).update_work_experience('000001', experience, existing)
+    return writer.calls
+
+
+def test_unchanged_jobs_are_left_alone():
+    assert decompress([row('recA', 'Acme', '2020-01-01')], [job('Acme', '2020-01-01')]) == []
+
+
+def test_same_job_is_updated_in_place():
+    calls = decompress([row('recA', 'Acme', '2020-01-01')], [job('Acme', '2020-01-01', title='Lead')])
+    assert calls == [('update', 'recA', {'Title': 'Lead'})]
+
+
+def test_replaced_job_gets_a_new_record():
+    # A deleted job's record is never turned into an unrelated job
+    calls = decompress([row('recX', 'Initech', '2018-01-01'), row('recA', 'Acme', '2020-01-01')],
+                       [job('Acme', '2020-01-01'), job('Globex', '2022-01-01')])
+    assert sorted(calls) == [('create', 'Globex'), ('delete', 'recX')]
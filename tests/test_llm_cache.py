@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from fakes import FakeGeminiModel
+from llm_cache import LLMCache, cache_key
+from llm_evaluation import LLMEvaluator, MODEL_NAME, PROMPT_VERSION
+from snapshot import OfflineModel
+
+PROFILE = '{"personal":{"name":"Applicant 1"}}'
+
+
+def test_read_only_cache_serves_lookups_but_stores_nothing(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    LLMCache(path).put('key', {'score': 7}, 'A1')
+
+    cache = LLMCache(path, read_only=True)
+    assert cache.get('key') == {'score': 7}
+    cache.put('other', {'score': 1}, 'A2')
+    assert cache.get('other') is None
+    assert LLMCache(path).stats()['entries'] == 1
+
+
+def test_fake_results_never_use_gemini_cache_keys(monkeypatch):
+    monkeypatch.setenv('AIRTABLE_API_KEY', 'test')
+    fake = LLMEvaluator(model=FakeGeminiModel(), cache=LLMCache(':memory:'), writer=object())
+    offline = LLMEvaluator(model=OfflineModel(MODEL_NAME), cache=LLMCache(':memory:'), writer=object())
+    assert offline.cache_model_name == MODEL_NAME
+    assert fake.cache_model_name != MODEL_NAME
+    assert cache_key(PROFILE, PROMPT_VERSION, fake.cache_model_name) != \
+        cache_key(PROFILE, PROMPT_VERSION, offline.cache_model_name)
+
+
+def test_read_only_cache_needs_an_existing_file(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        LLMCache(str(tmp_path / 'missing.sqlite'), read_only=True)
+
+
+def test_evicts_least_recently_used_overflow(tmp_path):
+    cache = LLMCache(str(tmp_path / 'cache.sqlite'), max_entries=3)
+    for n in range(3):
+        cache.put(f"key{n}", {'score': n})
+    cache.get('key0')  # now the most recently used
+    cache.put('key3', {'score': 3})
+    cache.put('key3', {'score': 4})  # replacing an entry does not evict another
+    assert cache.stats()['entries'] == 3
+    assert cache.get('key1') is None
+    assert cache.get('key0') == {'score': 0} and cache.get('key3') == {'score': 4}
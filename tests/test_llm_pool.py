@@ -0,0 +1,208 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import llm_pool
+from fakes import FakeGeminiModel
+from llm_pool import AdaptiveLimiter, LLMDeadlineExceeded, LLMWorkerPool, backoff_delay
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Record the pool's backoff sleeps instead of waiting them out
+    delays = []
+    monkeypatch.setattr(llm_pool, 'time', SimpleNamespace(monotonic=time.monotonic, sleep=delays.append))
+    return delays
+
+
+def generate(model):
+    return model.generate_content('prompt').text
+
+
+def test_limit_grows_with_fast_successes():
+    pool = LLMWorkerPool(initial_concurrency=2, target_latency=1.0)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, seed=1)
+    for _ in range(20):
+        pool.call(generate, model)
+    assert pool.limiter.limit > 4
+    assert pool.stats()['calls'] == 20
+
+
+def test_limit_halves_on_throttling(sleeps):
+    pool = LLMWorkerPool(initial_concurrency=8, max_retries=0)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, throttle_rate=1.0, seed=1)
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        pool.call(generate, model)
+    assert pool.limiter.limit == 4
+    assert pool.stats()['throttled'] == 1
+
+
+def test_limit_halves_on_slow_calls():
+    limiter = AdaptiveLimiter(initial=8, target_latency=0.5, cooldown=0.0)
+    limiter.acquire()
+    limiter.release(latency=2.0)
+    assert limiter.limit == 4
+
+
+def test_decrease_counts_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial=8, cooldown=60.0)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(congested=True)
+    assert limiter.limit == 4
+
+
+def test_in_flight_never_exceeds_limit():
+    pool = LLMWorkerPool(max_workers=8, initial_concurrency=2, target_latency=10.0)
+    model = FakeGeminiModel(latency=0.05, jitter=0.0, max_concurrency=2, seed=1)
+    # Keep the limit at 2 so any overshoot shows up as a fake 429
+    pool.limiter.maximum = 2
+    results = pool.map(lambda item, deadline: pool.call(generate, model, deadline=deadline), range(8))
+    assert not [r for r in results.values() if isinstance(r, Exception)]
+    assert model.errors == 0
+
+
+def test_retries_then_succeeds_with_jittered_backoff(monkeypatch):
+    sleeps = []
+    pool = LLMWorkerPool(base_delay=1.0, max_retries=5)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, error_rate=1.0, seed=1)
+
+    def recover(delay):
+        sleeps.append(delay)
+        if len(sleeps) == 2:
+            model.error_rate = 0.0
+
+    monkeypatch.setattr(llm_pool, 'time', SimpleNamespace(monotonic=time.monotonic, sleep=recover))
+    assert pool.call(generate, model).startswith('Summary:')
+    assert model.calls == 3
+    # Full jitter: attempt n waits somewhere in [0, base_delay * 2**n)
+    assert 0 <= sleeps[0] < 1.0 and 0 <= sleeps[1] < 2.0
+    assert pool.stats()['retries'] == 2
+
+
+def test_backoff_is_jittered():
+    random.seed(1)
+    delays = {backoff_delay(3, base_delay=1.0) for _ in range(20)}
+    assert len(delays) == 20
+    assert all(0 <= d < 8.0 for d in delays)
+
+
+def test_retry_after_hint_is_honoured(sleeps):
+    pool = LLMWorkerPool(base_delay=0.5, max_retries=1)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, throttle_rate=1.0, retry_after=3.0, seed=1)
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        pool.call(generate, model)
+    assert len(sleeps) == 1
+    assert 3.0 <= sleeps[0] <= 3.5
+
+
+def test_gives_up_after_max_retries(sleeps):
+    pool = LLMWorkerPool(max_retries=3)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, error_rate=1.0, seed=1)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        pool.call(generate, model)
+    assert model.calls == 4
+    assert pool.stats()['failures'] == 1
+
+
+def test_non_retryable_errors_fail_immediately(sleeps):
+    pool = LLMWorkerPool(max_retries=3)
+
+    def broken():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        pool.call(broken)
+    assert sleeps == []
+
+
+def test_deadline_stops_retrying(sleeps):
+    pool = LLMWorkerPool(base_delay=30.0, max_retries=5)
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, throttle_rate=1.0, retry_after=30.0, seed=1)
+    with pytest.raises(LLMDeadlineExceeded):
+        pool.call(generate, model, deadline=time.monotonic() + 5.0)
+    assert model.calls == 1
+    assert sleeps == []
+
+
+def test_deadline_while_waiting_for_a_slot():
+    pool = LLMWorkerPool(initial_concurrency=1)
+    pool.limiter.acquire()  # the only slot is taken
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        pool.call(lambda: 'never', deadline=started + 0.2)
+    assert time.monotonic() - started < 1.0
+
+
+def test_map_applies_one_deadline_to_every_item():
+    pool = LLMWorkerPool(max_workers=4, initial_concurrency=1)
+    model = FakeGeminiModel(latency=0.2, jitter=0.0, seed=1)
+    results = pool.map(lambda item, deadline: pool.call(generate, model, deadline=deadline),
+                       range(6), deadline_seconds=0.5)
+    finished = [r for r in results.values() if isinstance(r, str)]
+    expired = [r for r in results.values() if isinstance(r, LLMDeadlineExceeded)]
+    assert finished and expired
+    assert len(finished) + len(expired) == 6
+
+
+def test_evaluator_max_retries_counts_attempts(tmp_path, monkeypatch, sleeps):
+    from llm_cache import LLMCache
+    from llm_evaluation import LLMEvaluator
+    from record_context import ApplicantContext
+
+    monkeypatch.setenv('AIRTABLE_API_KEY', 'test')
+    model = FakeGeminiModel(latency=0.0, jitter=0.0, error_rate=1.0, seed=1)
+    evaluator = LLMEvaluator(model=model, cache=LLMCache(str(tmp_path / 'cache.sqlite')), writer=object())
+    context = ApplicantContext({'id': 'rec1', 'fields': {'Applicant ID': 'A1', 'Compressed JSON': '{"personal":{}}'}})
+    assert evaluator.evaluate_applicant('A1', max_retries=3, context=context) is False
+    assert model.calls == 3
+
+
+def test_concurrent_callers_share_the_limit():
+    pool = LLMWorkerPool(initial_concurrency=3)
+    pool.limiter.maximum = 3
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            peak.append(pool.limiter.in_flight)
+        time.sleep(0.02)
+
+    threads = [threading.Thread(target=pool.call, args=(work,)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 3
+
+
+def test_evaluator_runs_batches_concurrently(tmp_path, monkeypatch):
+    from llm_cache import LLMCache
+    from llm_evaluation import LLMEvaluator
+    from record_context import ApplicantContext
+
+    monkeypatch.setenv('AIRTABLE_API_KEY', 'test')
+    model = FakeGeminiModel(latency=0.05, jitter=0.0, seed=1)
+    peak = []
+    generate_content = model.generate_content
+
+    def tracked(prompt, **kwargs):
+        peak.append(model.in_flight)
+        return generate_content(prompt, **kwargs)
+
+    model.generate_content = tracked
+    pool = LLMWorkerPool(initial_concurrency=4)
+    evaluator = LLMEvaluator(model=model, pool=pool, cache=LLMCache(str(tmp_path / 'cache.sqlite')), writer=object())
+    contexts = {f"A{n}": ApplicantContext({'id': f"rec{n}", 'fields': {
+        'Applicant ID': f"A{n}", 'Compressed JSON': '{"personal":{"name":"Applicant %d"}}' % n}})
+        for n in range(8)}
+    results = evaluator.evaluate_applicants(list(contexts), max_batch_size=1, contexts=contexts)
+    assert all(results.values()) and len(results) == 8
+    assert model.calls == 8
+    # in_flight is read before the call counts itself, so any value above 0 means overlap
+    assert max(peak) >= 1
@@ -0,0 +1,43 @@
+import pytest
+from pyairtable import Api
+
+from fakes import FakeAirtable
+from json_codec import encode_profile
+from shortlist_candidates import CandidateShortlister
+
+BASE_ID = 'appTEST'
+
+PROFILE = encode_profile({
+    'personal': {'name': 'Applicant 1', 'location': 'Berlin, Germany'},
+    'experience': [{'company': 'Google', 'title': 'Engineer'}],
+    'salary': {'preferred_rate': 90, 'availability': 30}
+})
+
+
+@pytest.fixture
+def airtable():
+    air = FakeAirtable(rate=1000)
+    air.insert(BASE_ID, 'Applicants', [
+        {'Applicant ID': '000001', 'Compressed JSON': PROFILE, 'Shortlist Status': 'Shortlisted'},
+        {'Applicant ID': '000002', 'Compressed JSON': PROFILE, 'Shortlist Status': 'Shortlisted'}
+    ])
+    air.insert(BASE_ID, 'Shortlisted Leads', [
+        {'Applicant': '000001', 'Compressed JSON': PROFILE, 'Score Reason': 'Old criteria'}
+    ])
+    air.start()
+    yield air
+    air.stop()
+
+
+def test_population_run_refreshes_leads_of_applicants_still_shortlisted(airtable, monkeypatch):
+    monkeypatch.setenv('AIRTABLE_BASE_ID', BASE_ID)
+    shortlister = CandidateShortlister(api=Api('test-key', endpoint_url=airtable.url))
+    results = shortlister.evaluate_population()
+
+    leads = {r['fields']['Applicant']: r['fields']['Score Reason']
+             for r in airtable.records(BASE_ID, 'Shortlisted Leads')}
+    assert leads == {'000001': results['000001'][1], '000002': results['000002'][1]}
+    assert 'Google' in leads['000001']
+    # Statuses were unchanged, and the lead scan answers for everyone
+    assert ('Applicants', 'update') not in airtable.requests
+    assert airtable.requests[('Shortlisted Leads', 'list')] == 1
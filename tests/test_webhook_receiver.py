@@ -0,0 +1,161 @@
+import json
+import os
+
+import pytest
+from pyairtable import Api
+
+from child_index import ChildRowIndex
+from fakes import FakeAirtable
+from webhook_receiver import Debouncer, WebhookReceiver
+
+BASE_ID = 'appTEST'
+PAYLOADS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'webhook_payloads.json')
+
+
+class StubProcessor:
+    # Records the batches the receiver hands on instead of running the pipeline
+    def __init__(self, api, child_rows, fail_once=False):
+        self.api = api
+        self.base_id = BASE_ID
+        self.child_rows = child_rows
+        self.unfinished = set()
+        self.batches = []
+        self.fail_once = fail_once
+
+    def process_applicants(self, applicant_ids):
+        self.batches.append(sorted(applicant_ids))
+        if self.fail_once:
+            self.fail_once = False
+            raise RuntimeError("Airtable unavailable")
+        return list(applicant_ids)
+
+
+@pytest.fixture
+def airtable():
+    air = FakeAirtable(rate=1000)
+    air.insert(BASE_ID, 'Salary Preferences', [{'Applicant ID': '000001', 'Preferred Rate': 120}])
+    air.insert(BASE_ID, 'Personal Details', [{'Applicant ID': '000001', 'Full Name': 'Applicant 1'}])
+    air.start()
+    yield air
+    air.stop()
+
+
+@pytest.fixture
+def child_rows(tmp_path):
+    index = ChildRowIndex(str(tmp_path / 'child_rows.sqlite'))
+    # The deleted Personal Details row in the recording was compressed for 000003
+    index.add('Personal Details', {'rec00000000000002': '000003'})
+    return index
+
+
+@pytest.fixture
+def processor(airtable, child_rows):
+    return StubProcessor(Api('test-key', endpoint_url=airtable.url), child_rows)
+
+
+@pytest.fixture
+def receiver(processor, tmp_path):
+    # A long window so batches are only released by drain(). The fake has no
+    # schema endpoint, so the payloads name their tables
+    receiver = WebhookReceiver(processor, debounce_seconds=60.0, max_wait=60.0,
+                               cursor_path=str(tmp_path / 'cursor.json'))
+    yield receiver.start()
+    receiver.stop()
+
+
+def recorded_payloads():
+    with open(PAYLOADS_PATH, 'rb') as f:
+        return f.read()
+
+
+def test_replaying_recorded_payloads_processes_changed_applicants(receiver, processor):
+    status, reply = receiver.handle(recorded_payloads())
+    assert (status, reply) == (200, {'accepted': True})
+    receiver.wait()
+    assert receiver.debouncer.drain()
+    # 000002 comes from the payload, 000001 from a lookup of the changed
+    # salary row and 000003 from the index of the deleted row; the
+    # pipeline's own Applicants update is ignored
+    assert processor.batches == [['000001', '000002', '000003']]
+
+
+def test_rows_seen_in_payloads_are_indexed_and_deleted_rows_forgotten(receiver, child_rows):
+    receiver.applicant_ids(json.loads(recorded_payloads())['payloads'])
+    assert child_rows.applicants(['rec00000000000009', 'rec00000000000001', 'rec00000000000002']) == {
+        'rec00000000000009': '000002', 'rec00000000000001': '000001'}
+
+
+def test_unknown_deleted_rows_are_reported(receiver, child_rows, capsys):
+    child_rows.forget(['rec00000000000002'])
+    payload = {'changedTablesById': {'Work Experience': {'destroyedRecordIds': ['recUNKNOWN']}}}
+    assert receiver.applicant_ids([payload]) == set()
+    assert 'never indexed' in capsys.readouterr().out
+
+
+def test_index_replace_drops_rows_no_longer_read(child_rows):
+    child_rows.add('Work Experience', {'recOLD': '000003', 'recKEPT': '000003', 'recOTHER': '000004'})
+    child_rows.replace('Work Experience', {'000003'}, [{'id': 'recKEPT', 'fields': {'Applicant ID': '000003'}}])
+    assert child_rows.rows('Work Experience') == {'recKEPT': '000003', 'recOTHER': '000004'}
+
+
+def test_requests_are_acknowledged_before_any_lookup(processor, airtable, tmp_path):
+    receiver = WebhookReceiver(processor, cursor_path=str(tmp_path / 'cursor.json'))
+    assert receiver.handle(recorded_payloads())[0] == 200
+    assert not airtable.requests
+
+
+def test_rejects_unknown_messages(receiver):
+    assert receiver.handle(b'[]')[0] == 400
+    assert receiver.handle(b'not json')[0] == 400
+    assert receiver.handle(json.dumps({'hello': 'world'}).encode())[0] == 400
+
+
+def test_failed_batch_is_retried(receiver, processor):
+    processor.fail_once = True
+    receiver.handle(recorded_payloads())
+    receiver.wait()
+    receiver.debouncer.drain()
+    receiver.debouncer.drain()
+    assert processor.batches == [['000001', '000002', '000003'], ['000001', '000002', '000003']]
+
+
+def test_unfinished_applicants_are_retried(receiver, processor):
+    processor.unfinished = {'000002'}
+    receiver.handle(recorded_payloads())
+    receiver.wait()
+    receiver.debouncer.drain()
+    processor.unfinished = set()
+    receiver.debouncer.drain()
+    assert processor.batches == [['000001', '000002', '000003'], ['000002']]
+
+
+def test_debouncer_gives_up_after_max_retries():
+    calls = []
+    debouncer = Debouncer(lambda keys: calls.append(keys) or keys, window=0.0, max_retries=2)
+    debouncer.add(['A'])
+    while debouncer.drain():
+        pass
+    assert calls == [['A'], ['A'], ['A']]
+
+
+def test_cursor_is_saved_only_after_applicants_are_queued(receiver, processor, monkeypatch):
+    payloads = json.loads(recorded_payloads())['payloads']
+    monkeypatch.setattr(receiver, 'fetch_payloads', lambda webhook_id, cursor: (payloads, 5))
+    notification = json.dumps({'base': {'id': BASE_ID}, 'webhook': {'id': 'achTEST'},
+                               'timestamp': '2026-03-02T09:17:00.000Z'}).encode()
+    lookup = receiver.applicant_ids
+
+    def broken_lookup(payloads):
+        raise RuntimeError("Airtable unavailable")
+
+    monkeypatch.setattr(receiver, 'applicant_ids', broken_lookup)
+    assert receiver.handle(notification)[0] == 200
+    receiver.wait()
+    assert receiver.load_cursors() == {}
+
+    monkeypatch.setattr(receiver, 'applicant_ids', lookup)
+    receiver.handle(notification)
+    receiver.wait()
+    assert receiver.load_cursors() == {'achTEST': 5}
+    receiver.debouncer.drain()
+    assert processor.batches == [['000001', '000002', '000003']]
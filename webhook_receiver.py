@@ -0,0 +1,358 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from page_stream import chunked
+
+DEFAULT_CURSOR_PATH = '.webhook_cursor.json'
+
+# Changes to these tables mean an applicant's profile must be rebuilt.
+# Updates to Applicants itself are ignored: the pipeline writes them.
+SOURCE_TABLES = ('Personal Details', 'Work Experience', 'Salary Preferences')
+
+
+class Debouncer:
+    """Coalesces bursts of events per key before handing them on.
+
+    A key is released once ``window`` seconds pass without a new event for
+    it, or ``max_wait`` seconds after its first event, so a record being
+    edited continuously is still processed. Released keys are passed to
+    ``handler`` in one batch from a single background thread.
+
+    Keys the handler returns, or the whole batch if it raises, are added
+    back and retried after another window, up to ``max_retries`` times.
+    """
+
+    def __init__(self, handler, window=5.0, max_wait=30.0, max_retries=3):
+        self.handler = handler
+        self.window = window
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+
+        self._pending = {}  # key -> (first seen, last seen)
+        self._retries = {}  # key -> failed attempts so far
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='debouncer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, keys):
+        if not keys:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for key in keys:
+                first_seen = self._pending.get(key, (now, now))[0]
+                self._pending[key] = (first_seen, now)
+            self._cond.notify_all()
+
+    def _due(self, now):
+        due = [key for key, (first, last) in self._pending.items()
+               if now - last >= self.window or now - first >= self.max_wait]
+        for key in due:
+            del self._pending[key]
+        return due
+
+    def _next_due(self, now):
+        if not self._pending:
+            return None
+        return min(min(last + self.window, first + self.max_wait) - now
+                   for first, last in self._pending.values())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    due = self._due(time.monotonic())
+                    if due:
+                        break
+                    self._cond.wait(self._next_due(time.monotonic()))
+                else:
+                    return
+            self._dispatch(due)
+
+    def _dispatch(self, keys):
+        try:
+            failed = set(self.handler(keys) or ())
+        except Exception as e:
+            print(f"❌ Failed to process {len(keys)} changed applicants: {e}")
+            failed = set(keys)
+        self.retry(failed)
+        with self._cond:
+            for key in keys:
+                if key not in failed:
+                    self._retries.pop(key, None)
+
+    def retry(self, keys):
+        # Add failed keys back, except those already retried max_retries times
+        dropped = []
+        with self._cond:
+            for key in keys:
+                self._retries[key] = self._retries.get(key, 0) + 1
+                if self._retries[key] > self.max_retries:
+                    del self._retries[key]
+                    dropped.append(key)
+        if dropped:
+            print(f"❌ Giving up on {len(dropped)} applicants after {self.max_retries} retries: "
+                  f"{', '.join(map(str, sorted(dropped)))}")
+        self.add([key for key in keys if key not in dropped])
+
+    def drain(self):
+        # Hand on everything still waiting, without waiting for the window
+        with self._cond:
+            keys = list(self._pending)
+            self._pending.clear()
+        if keys:
+            self._dispatch(keys)
+        return keys
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class WebhookReceiver:
+    """HTTP endpoint for Airtable webhook notifications.
+
+    Airtable's notification only says that a webhook has new payloads, so
+    they are fetched from the API, resuming from a cursor saved in
+    ``.webhook_cursor.json``. Payloads can also be POSTed directly, either
+    one at a time or as ``{"payloads": [...]}`` as returned by the list
+    payloads endpoint, which is how recorded payloads are replayed locally.
+    Tables in posted payloads may be given by ID or by name.
+
+    Requests are acknowledged straight away; fetching payloads and looking
+    up Applicant IDs happen on a background intake thread, and a webhook's
+    cursor is only saved once its applicants are handed to the debouncer.
+    The Applicant IDs behind created, changed or deleted records are
+    debounced, and each batch runs through compress -> shortlist -> LLM.
+    Deleted rows are traced to their applicant through the processor's
+    ChildRowIndex.
+    """
+
+    def __init__(self, processor, debounce_seconds=5.0, max_wait=30.0, mac_secret=None, cursor_path=None,
+                 child_rows=None):
+        self.processor = processor
+        self.api = processor.api
+        self.base_id = processor.base_id
+        self.child_rows = child_rows or processor.child_rows
+        # Airtable's macSecretBase64 for the webhook; notifications are unchecked without it
+        secret = mac_secret or os.getenv('AIRTABLE_WEBHOOK_SECRET')
+        self.mac_secret = base64.b64decode(secret) if secret else None
+        self.cursor_path = cursor_path or os.getenv('WEBHOOK_CURSOR_PATH', DEFAULT_CURSOR_PATH)
+
+        self.debouncer = Debouncer(self.process, debounce_seconds, max_wait)
+        self._tables = None
+        self._fetch_lock = threading.Lock()
+        self._intake = queue.Queue()
+        self._intake_thread = threading.Thread(target=self._run_intake, name='webhook-intake', daemon=True)
+        self.server = None
+
+    def start(self):
+        self.debouncer.start()
+        self._intake_thread.start()
+        return self
+
+    def stop(self):
+        # Finish queued requests, then process everything still debounced
+        if self._intake_thread.is_alive():
+            self._intake.put(None)
+            self._intake_thread.join()
+        self.debouncer.stop()
+        self.debouncer.drain()
+
+    def serve(self, host='127.0.0.1', port=8080):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, reply = receiver.handle(body, self.headers.get('X-Airtable-Content-MAC'))
+                data = json.dumps(reply).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.start()
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        print(f"Listening for Airtable webhooks on http://{host}:{self.server.server_port}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.stop()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def handle(self, body, mac_header=None):
+        # Returns (HTTP status, JSON reply); Airtable only needs a quick 2xx
+        if self.mac_secret and not self.verify_mac(body, mac_header):
+            return 401, {'error': 'bad signature'}
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'invalid JSON'}
+        if not isinstance(message, dict):
+            return 400, {'error': 'expected a JSON object'}
+
+        if 'payloads' in message:
+            self._intake.put(('payloads', message['payloads']))
+        elif 'changedTablesById' in message:
+            self._intake.put(('payloads', [message]))
+        elif 'webhook' in message:
+            self._intake.put(('webhook', message['webhook']['id']))
+        else:
+            return 400, {'error': 'not a webhook notification or payload'}
+        return 200, {'accepted': True}
+
+    def wait(self):
+        # Block until every acknowledged request has been ingested
+        self._intake.join()
+
+    def _run_intake(self):
+        while True:
+            item = self._intake.get()
+            try:
+                if item is None:
+                    return
+                self.ingest(*item)
+            except Exception as e:
+                # The webhook's cursor was not saved, so the next notification fetches these again
+                print(f"❌ Failed to ingest webhook {item[0]}: {e}")
+            finally:
+                self._intake.task_done()
+
+    def ingest(self, kind, value):
+        if kind == 'payloads':
+            self.debouncer.add(self.applicant_ids(value))
+            return
+        # One fetch at a time so two notifications never share a cursor
+        with self._fetch_lock:
+            cursors = self.load_cursors()
+            payloads, cursors[value] = self.fetch_payloads(value, cursors.get(value, 1))
+            self.debouncer.add(self.applicant_ids(payloads))
+            self.save_cursors(cursors)
+
+    def process(self, applicant_ids):
+        # Debouncer handler: returns the applicants to retry
+        self.processor.process_applicants(applicant_ids)
+        return [a for a in applicant_ids if a in self.processor.unfinished]
+
+    def verify_mac(self, body, mac_header):
+        expected = 'hmac-sha256=' + hmac.new(self.mac_secret, body, hashlib.sha256).hexdigest()
+        return mac_header is not None and hmac.compare_digest(expected, mac_header)
+
+    def fetch_payloads(self, webhook_id, cursor=1):
+        # Payloads from ``cursor`` on, and the cursor to resume from next time
+        payloads = []
+        for payload in self.api.base(self.base_id).webhook(webhook_id).payloads(cursor):
+            payloads.append(payload.model_dump(by_alias=True, mode='json'))
+            cursor = payload.cursor + 1
+        return payloads, cursor
+
+    def load_cursors(self):
+        try:
+            with open(self.cursor_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_cursors(self, cursors):
+        tmp_path = self.cursor_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cursors, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def tables(self):
+        # Table ID -> (name, ID of its Applicant ID field), read from the base schema once
+        if self._tables is None:
+            try:
+                schema = self.api.base(self.base_id).schema()
+                self._tables = {
+                    table.id: (table.name, next((f.id for f in table.fields if f.name == 'Applicant ID'), None))
+                    for table in schema.tables
+                }
+            except Exception as e:
+                print(f"Could not read base schema ({e}); payload tables must be given by name")
+                self._tables = {}
+        return self._tables
+
+    def changed_records(self, payloads):
+        # {table name: {record ID: cell values}} for records that affect a profile
+        changes = {}
+        for payload in payloads:
+            for table_key, table_changes in payload.get('changedTablesById', {}).items():
+                table_name, field_id = self.tables().get(table_key, (table_key, None))
+                records = dict(table_changes.get('createdRecordsById', {}))
+                if table_name in SOURCE_TABLES:
+                    for record_id, change in table_changes.get('changedRecordsById', {}).items():
+                        records[record_id] = change.get('current', {})
+                elif table_name != 'Applicants':
+                    continue
+                for record_id, record in records.items():
+                    cells = record.get('cellValuesByFieldId', {})
+                    changes.setdefault(table_name, {})[record_id] = cells.get(field_id) or cells.get('Applicant ID')
+        return changes
+
+    def deleted_records(self, payloads):
+        # {table name: [record ID, ...]} for deleted rows that were part of a profile
+        deleted = {}
+        for payload in payloads:
+            for table_key, table_changes in payload.get('changedTablesById', {}).items():
+                table_name = self.tables().get(table_key, (table_key, None))[0]
+                if table_name in SOURCE_TABLES and table_changes.get('destroyedRecordIds'):
+                    deleted.setdefault(table_name, []).extend(table_changes['destroyedRecordIds'])
+        return deleted
+
+    def applicant_ids(self, payloads):
+        # Applicant IDs come from the payload when it carries them, otherwise
+        # from one lookup per table. Deleted rows can no longer be looked up,
+        # so they are resolved through the child row index.
+        applicant_ids = set()
+        for table_name, records in self.changed_records(payloads).items():
+            missing = [record_id for record_id, value in records.items() if not value]
+            table = self.api.table(self.base_id, table_name)
+            for chunk in chunked(missing, 50):
+                formula = "OR(" + ", ".join(f"RECORD_ID() = '{r}'" for r in chunk) + ")"
+                for record in table.all(formula=formula, fields=['Applicant ID']):
+                    records[record['id']] = record['fields'].get('Applicant ID')
+            applicant_ids.update(value for value in records.values() if value)
+            if table_name in SOURCE_TABLES:
+                self.child_rows.add(table_name, records)
+
+        for table_name, record_ids in self.deleted_records(payloads).items():
+            known = self.child_rows.applicants(record_ids)
+            applicant_ids.update(known.values())
+            if len(known) < len(record_ids):
+                print(f"⚠️ {len(record_ids) - len(known)} deleted {table_name} rows were never indexed; "
+                      f"their applicants are not recompressed")
+            self.child_rows.forget(record_ids)
+        return applicant_ids
+
+
+# Usage: python webhook_receiver.py [port]
+# Replay a recorded payload: curl -X POST -d @payload.json http://127.0.0.1:8080/
+if __name__ == "__main__":
+    from master_script import ApplicationProcessor
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    WebhookReceiver(ApplicationProcessor()).serve(port=port)
@@ -0,0 +1,209 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from page_stream import chunked
+
+DEFAULT_QUEUE_PATH = '.work_queue.sqlite'
+
+
+class Lease:
+    def __init__(self, lease_id, applicant_ids, worker_id):
+        self.lease_id = lease_id
+        self.applicant_ids = applicant_ids
+        self.worker_id = worker_id
+
+
+class LeaseQueue:
+    """Applicant IDs split into leases that worker processes claim.
+
+    A claimed lease belongs to its worker until ``lease_seconds`` pass
+    without a heartbeat; after that any worker may claim it again. A lease
+    that keeps failing is parked as ``failed`` after ``max_attempts`` and
+    its applicants can be enqueued again.
+
+    State lives in one SQLite file in WAL mode, which relies on shared
+    memory, so only workers on the same host can share it; keep it off
+    network filesystems. Workers on several hosts need a networked queue
+    (Redis, say) with the same methods.
+    """
+
+    def __init__(self, path=None, lease_seconds=120, max_attempts=5):
+        self.path = path or os.getenv('WORK_QUEUE_PATH', DEFAULT_QUEUE_PATH)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                lease_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                applicant_ids TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Applicants currently queued or leased, so re-enqueueing is a no-op
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lease_items (
+                applicant_id TEXT PRIMARY KEY,
+                lease_id INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS leases_state ON leases (state)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+        # never claim the same lease
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, applicant_ids, lease_size=50):
+        # Returns the number of applicants added
+        added = 0
+        with self._transaction() as conn:
+            queued = {row[0] for row in conn.execute("SELECT applicant_id FROM lease_items")}
+            fresh = [a for a in dict.fromkeys(applicant_ids) if a not in queued]
+            for chunk in chunked(fresh, lease_size):
+                lease_id = conn.execute(
+                    "INSERT INTO leases (applicant_ids) VALUES (?)", (json.dumps(chunk),)
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO lease_items (applicant_id, lease_id) VALUES (?, ?)",
+                    [(a, lease_id) for a in chunk]
+                )
+                added += len(chunk)
+        return added
+
+    def claim(self, worker_id):
+        # Next pending lease, or one whose owner stopped heartbeating
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE leases SET state = 'failed' WHERE state = 'leased' AND expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            )
+            self._free_failed(conn)
+            row = conn.execute(
+                "SELECT lease_id, applicant_ids, state, owner FROM leases "
+                "WHERE state = 'pending' OR (state = 'leased' AND expires < ?) "
+                "ORDER BY lease_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            lease_id, applicant_ids, state, owner = row
+            conn.execute(
+                "UPDATE leases SET state = 'leased', owner = ?, expires = ?, attempts = attempts + 1 "
+                "WHERE lease_id = ?",
+                (worker_id, now + self.lease_seconds, lease_id)
+            )
+        if state == 'leased':
+            print(f"Reclaimed expired lease {lease_id} from {owner}")
+        return Lease(lease_id, json.loads(applicant_ids), worker_id)
+
+    def heartbeat(self, lease):
+        # False once the lease has expired and been claimed by someone else
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE leases SET expires = ? WHERE lease_id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, lease.lease_id, lease.worker_id)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, lease, unfinished=()):
+        # Applicants in ``unfinished`` move to a new pending lease that
+        # inherits this lease's attempts, so they are retried but can fail
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM leases WHERE lease_id = ? AND owner = ? AND state = 'leased'",
+                (lease.lease_id, lease.worker_id)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE leases SET state = 'done', expires = NULL WHERE lease_id = ?", (lease.lease_id,))
+            unfinished = [a for a in dict.fromkeys(unfinished) if a in lease.applicant_ids]
+            if unfinished:
+                state = 'failed' if row[0] >= self.max_attempts else 'pending'
+                retry_id = conn.execute(
+                    "INSERT INTO leases (applicant_ids, state, attempts) VALUES (?, ?, ?)",
+                    (json.dumps(unfinished), state, row[0])
+                ).lastrowid
+                conn.executemany(
+                    "UPDATE lease_items SET lease_id = ? WHERE applicant_id = ? AND lease_id = ?",
+                    [(retry_id, a, lease.lease_id) for a in unfinished]
+                )
+            conn.execute("DELETE FROM lease_items WHERE lease_id = ?", (lease.lease_id,))
+            self._free_failed(conn)
+        return True
+
+    def release(self, lease):
+        # Hand a lease back after an error so another worker can retry it
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE leases SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, expires = NULL WHERE lease_id = ? AND owner = ?",
+                (self.max_attempts, lease.lease_id, lease.worker_id)
+            )
+            self._free_failed(conn)
+
+    def _free_failed(self, conn):
+        # A failed lease no longer holds its applicants, so they can be enqueued again
+        conn.execute(
+            "DELETE FROM lease_items WHERE lease_id IN (SELECT lease_id FROM leases WHERE state = 'failed')"
+        )
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM leases GROUP BY state"
+            ).fetchall())
+        return {state: counts.get(state, 0) for state in ('pending', 'leased', 'done', 'failed')}
+
+    def remaining(self):
+        stats = self.stats()
+        return stats['pending'] + stats['leased']
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@contextmanager
+def keep_alive(queue, lease, interval=None):
+    """Heartbeat ``lease`` from a background thread while the block runs."""
+    interval = interval or queue.lease_seconds / 3
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            if not queue.heartbeat(lease):
+                print(f"Lost lease {lease.lease_id}; another worker may redo it")
+                return
+
+    thread = threading.Thread(target=beat, name=f"lease-{lease.lease_id}", daemon=True)
+    thread.start()
+    try:
+        yield lease
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Usage: python work_queue.py
+if __name__ == "__main__":
+    print(LeaseQueue().stats())